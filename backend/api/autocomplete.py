@@ -0,0 +1,69 @@
+import threading
+from bisect import bisect_left
+from heapq import merge
+from itertools import chain
+
+from .references import ingredient_cache
+
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+
+def sort_key(item):
+    return item['name'].lower(), item['id']
+
+
+class IngredientIndex:
+    """
+    Индекс продуктов в памяти процесса для автодополнения.
+
+    Хранит продукты, отсортированные по имени в нижнем регистре: совпадения
+    по началу строки находятся бинарным поиском, совпадения по подстроке —
+    проходом по остальной части списка. Индекс строится из ingredient_cache
+    и у них одна проверка версии и одно время жизни: после перезагрузки
+    кэша индекс строится заново, а дочитанные кэшем продукты вливаются в
+    уже отсортированный список.
+    """
+
+    def __init__(self, reference=ingredient_cache):
+        self.reference = reference
+        self._lock = threading.Lock()
+        # (поколение кэша, его словарь, ключи, продукты)
+        self._state = (None, None, [], [])
+
+    def _load(self):
+        # Поколение читается до словаря: при перезагрузке между ними
+        # индекс просто будет построен заново при следующем вызове.
+        generation = self.reference.generation
+        source = self.reference.all()
+        state = self._state
+        if state[1] is source:
+            return state[2:]
+        with self._lock:
+            state = self._state
+            if state[1] is source:
+                return state[2:]
+            if state[0] == generation and len(state[3]) < len(source):
+                known = {item['id'] for item in state[3]}
+                added = sorted((item for pk, item in source.items()
+                                if pk not in known), key=sort_key)
+                items = list(merge(state[3], added, key=sort_key))
+            else:
+                items = sorted(source.values(), key=sort_key)
+            keys = [item['name'].lower() for item in items]
+            self._state = (generation, source, keys, items)
+            return keys, items
+
+    def search(self, query):
+        """Сначала продукты, начинающиеся с query, затем содержащие его."""
+        query = query.lower()
+        keys, items = self._load()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + PREFIX_UPPER_BOUND, start)
+        return items[start:end] + [
+            items[index]
+            for index in chain(range(start), range(end, len(keys)))
+            if query in keys[index]
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,355 @@
+"""
+Замеры числа SQL-запросов, задержки и выделений памяти по эндпоинтам API.
+
+Сценарий — функция, выполняющая один или несколько запросов тестовым
+клиентом. Для каждого сценария измеряются: число запросов к базе
+(детерминировано и сравнивается строго), p50/p95/p99 задержки по
+нескольким повторам (сравнивается p50) и пик выделенной Python памяти по
+tracemalloc. Перед каждым повтором кэш очищается, так что замеряется
+путь без кэша ответов. Сценарий может задать настройки, с которыми он
+выполняется, например, чтобы сравнить режимы одного эндпоинта.
+Результаты сравниваются с базовыми значениями из BASELINE_PATH
+(см. команду benchmark_api).
+"""
+import base64
+import gc
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from statistics import median, quantiles
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag, User
+from .fields import Base64ImageField
+from .references import ingredient_cache, tag_cache
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+RECIPE_IMAGE_SIDE = 1200
+# Сколько рецептов добавляет и убирает сценарий массового действия.
+BULK_SIZE = 10
+# Меньшие абсолютные отклонения считаются шумом, а не регрессией.
+NOISE = {'p50_ms': 5, 'alloc_kb': 32}
+
+
+@dataclass
+class Scenario:
+    name: str
+    user: str
+    run: callable
+    statuses: tuple = (200,)
+    settings: dict = field(default_factory=dict)
+
+
+def build_context():
+    """Объекты, на которых выполняются сценарии."""
+    reader = User.objects.annotate(carts=Count('shoppingcarts')).filter(
+        carts__gt=0).order_by('-follows_count', '-carts', 'id').first()
+    recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+    free_recipes = list(Recipe.objects.exclude(
+        shoppingcarts__user=reader).exclude(
+        favorites__user=reader).order_by('id')[:BULK_SIZE])
+    free_recipe = free_recipes[0]
+    author = User.objects.exclude(id=reader.id).exclude(
+        authors__user=reader).order_by('-recipes_count', 'id').first()
+    total = Recipe.objects.count()
+    middle = Recipe.objects.order_by('-pub_date', '-id')[total // 2]
+    cursor = base64.urlsafe_b64encode(json.dumps(
+        [0, middle.pub_date.isoformat(), middle.id]).encode()).decode()
+    ingredient = Ingredient.objects.order_by('id').first()
+    admin = User.objects.filter(is_staff=True).first()
+    if admin is None:
+        admin = User.objects.create_superuser(
+            'benchmark-admin', 'benchmark-admin@example.com', 'password')
+    return {
+        'users': {None: None, 'reader': reader, 'author': recipe.author,
+                  'admin': admin},
+        'recipe': recipe,
+        'free_recipe': free_recipe,
+        'free_recipe_ids': [recipe.id for recipe in free_recipes],
+        'author': author,
+        'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+        'all_tags': list(Tag.objects.values_list('slug', flat=True)),
+        'deep_page': max(total // 6, 1),
+        'cursor': cursor,
+        'ingredient': ingredient,
+        'ingredient_query': ingredient.name[:3],
+        'ingredient_queries': [ingredient.name[:1], ingredient.name[:3],
+                               ingredient.name, ingredient.name.upper(),
+                               'нет такого продукта'],
+        'image': image_data_url(RECIPE_IMAGE_SIDE),
+        'small_image': image_data_url(8),
+    }
+
+
+def image_data_url(side):
+    buffer = BytesIO()
+    Image.effect_noise((side, side), 64).convert('RGB').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def recipe_payload(ctx, recipe=None):
+    recipe = recipe or ctx['recipe']
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'tags': list(recipe.tags.values_list('id', flat=True)),
+        'ingredients': [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in recipe.recipe_ingredients.values_list(
+                'ingredient_id', 'amount')],
+    }
+
+
+def toggle(client, path):
+    client.post(path)
+    return client.delete(path)
+
+
+def bulk_toggle(client, path, ids):
+    client.post(path, {'ids': ids}, format='json')
+    return client.delete(path, {'ids': ids}, format='json')
+
+
+def search_ingredients(client, ctx):
+    for query in ctx['ingredient_queries']:
+        response = client.get('/api/ingredients/', {'name': query})
+    return response
+
+
+def create_and_delete(client, ctx):
+    response = client.post(
+        '/api/recipes/',
+        {**recipe_payload(ctx), 'image': ctx['small_image']}, format='json')
+    client.delete(f'/api/recipes/{response.data["id"]}/')
+    return response
+
+
+SCENARIOS = [
+    Scenario('recipes_list', None,
+             lambda client, ctx: client.get('/api/recipes/')),
+    Scenario('recipes_list_auth', 'reader',
+             lambda client, ctx: client.get('/api/recipes/')),
+    Scenario('recipes_filter_tags', 'reader',
+             lambda client, ctx: client.get(
+                 '/api/recipes/', {'tags': ctx['tags']})),
+    Scenario('recipes_filter_all_tags', 'reader',
+             lambda client, ctx: client.get(
+                 '/api/recipes/', {'tags': ctx['all_tags'], 'limit': 50})),
+    Scenario('recipes_filter_author', 'reader',
+             lambda client, ctx: client.get(
+                 '/api/recipes/', {'author': ctx['author'].id})),
+    Scenario('recipes_filter_cart', 'reader',
+             lambda client, ctx: client.get(
+                 '/api/recipes/', {'is_in_shopping_cart': 1})),
+    Scenario('recipes_search', None,
+             lambda client, ctx: client.get(
+                 '/api/recipes/', {'search': 'суп'})),
+    Scenario('recipes_popular', None,
+             lambda client, ctx: client.get(
+                 '/api/recipes/', {'ordering': 'popular'})),
+    Scenario('recipes_deep_page', None,
+             lambda client, ctx: client.get(
+                 '/api/recipes/', {'page': ctx['deep_page']})),
+    Scenario('recipes_cursor_deep_page', None,
+             lambda client, ctx: client.get(
+                 '/api/recipes/', {'cursor': ctx['cursor']})),
+    Scenario('recipes_trending', None,
+             lambda client, ctx: client.get('/api/recipes/trending/')),
+    Scenario('recipes_feed', 'reader',
+             lambda client, ctx: client.get('/api/recipes/feed/')),
+    Scenario('recipe_detail', 'reader',
+             lambda client, ctx: client.get(
+                 f'/api/recipes/{ctx["recipe"].id}/')),
+    Scenario('recipe_get_link', None,
+             lambda client, ctx: client.get(
+                 f'/api/recipes/{ctx["recipe"].id}/get-link/')),
+    Scenario('recipe_update', 'author',
+             lambda client, ctx: client.patch(
+                 f'/api/recipes/{ctx["recipe"].id}/', recipe_payload(ctx),
+                 format='json')),
+    Scenario('recipe_create_delete', 'author', create_and_delete, (201,)),
+    Scenario('favorite_toggle', 'reader',
+             lambda client, ctx: toggle(
+                 client, f'/api/recipes/{ctx["free_recipe"].id}/favorite/'),
+             (204,)),
+    Scenario('shopping_cart_toggle', 'reader',
+             lambda client, ctx: toggle(
+                 client,
+                 f'/api/recipes/{ctx["free_recipe"].id}/shopping_cart/'),
+             (204,)),
+    Scenario('shopping_cart_bulk_toggle', 'reader',
+             lambda client, ctx: bulk_toggle(
+                 client, '/api/recipes/shopping_cart/bulk/',
+                 ctx['free_recipe_ids'])),
+    *(Scenario(f'download_shopping_cart_{file_format}', 'reader',
+               lambda client, ctx, file_format=file_format: client.get(
+                   '/api/recipes/download_shopping_cart/',
+                   {'format': file_format}))
+      for file_format in ('txt', 'csv', 'pdf')),
+    Scenario('ingredients_list', None,
+             lambda client, ctx: client.get('/api/ingredients/')),
+    Scenario('ingredients_search', None,
+             lambda client, ctx: client.get(
+                 '/api/ingredients/', {'name': ctx['ingredient_query']})),
+    # Одни и те же запросы при поиске в базе и по индексу в памяти.
+    *(Scenario(f'ingredients_search_{mode}', None, search_ingredients,
+               settings={'INGREDIENT_SEARCH': mode})
+      for mode in ('database', 'memory')),
+    Scenario('ingredient_detail', None,
+             lambda client, ctx: client.get(
+                 f'/api/ingredients/{ctx["ingredient"].id}/')),
+    Scenario('tags_list', None,
+             lambda client, ctx: client.get('/api/tags/')),
+    Scenario('users_list', None,
+             lambda client, ctx: client.get('/api/users/', {'limit': 6})),
+    Scenario('user_detail', None,
+             lambda client, ctx: client.get(
+                 f'/api/users/{ctx["author"].id}/')),
+    Scenario('users_me', 'reader',
+             lambda client, ctx: client.get('/api/users/me/')),
+    Scenario('subscriptions', 'reader',
+             lambda client, ctx: client.get(
+                 '/api/users/subscriptions/',
+                 {'limit': 6, 'recipes_limit': 3})),
+    Scenario('subscribe_toggle', 'reader',
+             lambda client, ctx: toggle(
+                 client, f'/api/users/{ctx["author"].id}/subscribe/'),
+             (204,)),
+    Scenario('cache_stats', 'admin',
+             lambda client, ctx: client.get('/api/cache/stats/')),
+    Scenario('token_login', None,
+             lambda client, ctx: client.post(
+                 '/api/auth/token/login/',
+                 {'email': ctx['users']['reader'].email,
+                  'password': 'password'})),
+    Scenario('base64_image_decode', None,
+             lambda client, ctx: Base64ImageField().to_internal_value(
+                 ctx['image'])),
+]
+
+
+def get_client(ctx, user):
+    client = APIClient()
+    if ctx['users'][user] is not None:
+        client.force_authenticate(ctx['users'][user])
+    return client
+
+
+def call(scenario, client, ctx):
+    result = scenario.run(client, ctx)
+    if getattr(result, 'streaming', False):
+        b''.join(result.streaming_content)
+    return result
+
+
+def check_status(scenario, result):
+    status = getattr(result, 'status_code', None)
+    if status is None or status in scenario.statuses:
+        return None
+    return f'статус {status} вместо {"/".join(map(str, scenario.statuses))}'
+
+
+def clear_cache():
+    """
+    Очищает кэш ответов, оставляя справочники прогретыми.
+
+    Очистка сбрасывает и версии групп, так что справочники перечитываются
+    здесь, вне замера, как в рабочем процессе с уже прогретым кэшем.
+    """
+    cache.clear()
+    for reference in (tag_cache, ingredient_cache):
+        reference.invalidate()
+        reference.all()
+
+
+def measure(scenario, ctx, repeat):
+    """Замеры одного сценария: запросы, задержки и пик памяти."""
+    with override_settings(**scenario.settings):
+        return _measure(scenario, ctx, repeat)
+
+
+def _measure(scenario, ctx, repeat):
+    client = get_client(ctx, scenario.user)
+    clear_cache()
+    warning = check_status(scenario, call(scenario, client, ctx))
+
+    clear_cache()
+    with CaptureQueriesContext(connection) as queries:
+        call(scenario, client, ctx)
+    # Журнал запросов сбрасывается в начале каждого запроса клиента.
+    query_count = len(queries.captured_queries)
+
+    timings = []
+    for _ in range(repeat):
+        clear_cache()
+        # Как в timeit: сборка мусора не попадает в замер.
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            call(scenario, client, ctx)
+            timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            gc.enable()
+
+    clear_cache()
+    tracemalloc.start()
+    try:
+        call(scenario, client, ctx)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'queries': query_count,
+        'p50_ms': round(median(timings), 2),
+        'p95_ms': round(quantiles(timings, n=20)[-1]
+                        if len(timings) > 1 else timings[0], 2),
+        'p99_ms': round(quantiles(timings, n=100)[-1]
+                        if len(timings) > 1 else timings[0], 2),
+        'alloc_kb': round(peak / 1024, 1),
+    }, warning
+
+
+def compare(results, baseline, threshold, check_latency=True):
+    """Список регрессий относительно baseline."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(f'{name}: запросов {result["queries"]} '
+                               f'вместо {base["queries"]}')
+        # p95 на общих машинах слишком шумный, поэтому сравнивается p50.
+        metrics = ['alloc_kb'] + (['p50_ms'] if check_latency else [])
+        for metric in metrics:
+            if (result[metric] > base[metric] * (1 + threshold)
+                    and result[metric] - base[metric] > NOISE[metric]):
+                regressions.append(f'{name}: {metric} {result[metric]} '
+                                   f'при базовом {base[metric]}')
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not Path(path).exists():
+        return None
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_baseline(data, path=BASELINE_PATH):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
@@ -0,0 +1,88 @@
+"""
+Кэш ответов API для анонимных пользователей.
+
+Ответы list/retrieve хранятся в кэше Django под ключом из группы, версии
+группы и пути с отсортированными параметрами запроса. При изменении
+данных сигналы меняют версию группы, и старые ключи больше не читаются,
+поэтому удалять их по шаблону не нужно — они вытесняются по TTL.
+
+Версия группы — время её последнего изменения в наносекундах, она же
+служит валидатором для условных запросов (см. api.conditional).
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+STATS_KEYS = {'hits': 'api:cache:hits', 'misses': 'api:cache:misses'}
+
+
+def get_version(group):
+    key = f'api:cache:version:{group}'
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, settings.CACHE_VERSION_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate(*groups):
+    """Сбрасывает группы после фиксации текущей транзакции."""
+    def bump():
+        version = time.time_ns()
+        cache.set_many({f'api:cache:version:{group}': version
+                        for group in groups},
+                       settings.CACHE_VERSION_TIMEOUT)
+    transaction.on_commit(bump)
+
+
+def response_cache_key(group, request):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'api:cache:{group}:{get_version(group)}:{digest}'
+
+
+def count(stat):
+    key = STATS_KEYS[stat]
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_stats():
+    values = cache.get_many(STATS_KEYS.values())
+    return {stat: values.get(key, 0) for stat, key in STATS_KEYS.items()}
+
+
+class CachedResponseMixin:
+    """Кэширует ответы list и retrieve для анонимных пользователей."""
+
+    cache_group = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request,
+                                    *args, **kwargs)
+
+    def cached_response(self, view, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        key = response_cache_key(self.cache_group, request)
+        data = cache.get(key)
+        if data is not None:
+            count('hits')
+            return Response(data)
+        count('misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TTL)
+        return response
@@ -0,0 +1,77 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для эндпоинтов API.
+
+Валидатор строится из версий групп данных (см. api.cache), личной версии
+пользователя (меняется при изменении его избранного, корзины и подписок)
+и запрошенного пути. Поэтому ответ 304 отдаётся до выборки и
+сериализации данных.
+"""
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import get_version
+
+
+def user_group(user_id):
+    return f'user:{user_id}'
+
+
+class ConditionalGetMixin:
+    """Поддержка If-None-Match / If-Modified-Since для list и retrieve."""
+
+    etag_groups = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request,
+                                         *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request,
+                                         *args, **kwargs)
+
+    def get_validators(self, request):
+        groups = list(self.etag_groups)
+        if request.user.is_authenticated:
+            groups.append(user_group(request.user.id))
+        versions = [get_version(group) for group in groups]
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        digest = hashlib.md5(
+            f'{request.user.id}:{request.path}?{query}:{versions}'.encode()
+        ).hexdigest()
+        last_modified = max(versions) // 10 ** 9
+        # Last-Modified точен до секунды: пока секунда последнего изменения
+        # не закончилась, в неё может попасть ещё одно, и по
+        # If-Modified-Since клиент получил бы устаревший 304.
+        if last_modified >= int(time.time()):
+            last_modified = None
+        return f'"{digest}"', last_modified
+
+    def conditional_response(self, view, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+def conditional(method):
+    """Декоратор условных запросов для дополнительных действий вьюсета."""
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda *args, **kwargs: method(self, *args, **kwargs),
+            request, *args, **kwargs)
+    return wrapper
@@ -1,17 +1,134 @@
 import base64
+import binascii
 import uuid
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 
+# Кусок base64 для декодирования за раз, кратен 4.
+DECODE_CHUNK_SIZE = 64 * 1024
+# Переносы строк и пробелы, которые допускаются внутри base64.
+WHITESPACE = ('\n', '\r', ' ', '\t')
+# Сигнатуры форматов: (смещение, байты, расширение, MIME-тип).
+IMAGE_SIGNATURES = (
+    (0, b'\x89PNG\r\n\x1a\n', 'png', 'image/png'),
+    (0, b'\xff\xd8\xff', 'jpg', 'image/jpeg'),
+    (0, b'GIF87a', 'gif', 'image/gif'),
+    (0, b'GIF89a', 'gif', 'image/gif'),
+    (8, b'WEBP', 'webp', 'image/webp'),
+    (4, b'ftypavif', 'avif', 'image/avif'),
+)
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """
+    Временный файл с декодированной картинкой.
+
+    Хранилище перемещает его на место вместо копирования, после чего
+    закрытие (в отличие от сборки мусора у tempfile) не падает на уже
+    отсутствующем файле.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+def sniff_image_type(head):
+    """Определяет формат картинки по первым байтам файла."""
+    for offset, signature, extension, content_type in IMAGE_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return extension, content_type
+    return None
+
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_large': 'Изображение больше {max_side}px по одной из сторон.',
+        'too_big': 'Размер изображения больше {max_size} байт.',
+        'invalid_base64': 'Некорректные данные изображения в base64.',
+        'unknown_format': 'Неподдерживаемый формат изображения.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            file_name = f'{uuid.uuid4()}.{ext}'
+            data = self.decode(data)
+
+        file = super().to_internal_value(data)
+        # Django проверяет картинку по заголовку и сохраняет её в file.image
+        # без декодирования пикселей, так что размеры узнаются дёшево.
+        image = getattr(file, 'image', None)
+        if image is not None and max(image.size) > settings.IMAGE_MAX_SIDE:
+            self.fail('too_large', max_side=settings.IMAGE_MAX_SIDE)
+        return file
+
+    def decode(self, data):
+        """
+        Декодирует data URL кусками во временный файл.
+
+        Размер проверяется по длине строки до декодирования, а формат — по
+        первым байтам, так что в памяти не держится ни копия строки, ни
+        весь декодированный файл. Переносы строк и пробелы внутри base64
+        пропускаются, как и при декодировании без validate.
+        """
+        start = data.find(';base64,', 0, 100)
+        if start == -1:
+            self.fail('invalid_base64')
+        start += len(';base64,')
+        max_size = settings.IMAGE_MAX_UPLOAD_SIZE
+        length = (len(data) - start - data.count('\n', start)
+                  - data.count('\r', start))
+        if length // 4 * 3 > max_size:
+            self.fail('too_big', max_size=max_size)
+
+        has_whitespace = any(char in data for char in WHITESPACE)
+        file = None
+        rest = ''
+        try:
+            for offset in range(start, len(data), DECODE_CHUNK_SIZE):
+                encoded = rest + data[offset:offset + DECODE_CHUNK_SIZE]
+                if has_whitespace:
+                    encoded = ''.join(encoded.split())
+                # Без пробелов кусок может оказаться не кратен 4: хвост
+                # декодируется вместе со следующим.
+                end = len(encoded) - len(encoded) % 4
+                encoded, rest = encoded[:end], encoded[end:]
+                if not encoded:
+                    continue
+                chunk = base64.b64decode(encoded, validate=True)
+                if file is None:
+                    image_type = sniff_image_type(chunk)
+                    if image_type is None:
+                        self.fail('unknown_format')
+                    extension, content_type = image_type
+                    file = DecodedImageFile(
+                        f'{uuid.uuid4()}.{extension}', content_type, 0, None)
+                file.write(chunk)
+            if rest:
+                raise binascii.Error('Incorrect padding')
+        except binascii.Error:
+            if file is not None:
+                file.close()
+            self.fail('invalid_base64')
+        if file is None:
+            self.fail('invalid_base64')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
 
-            data = ContentFile(base64.b64decode(imgstr), name=file_name)
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки: {формат: {ширина: url}}."""
 
-        return super().to_internal_value(data)
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        build_url = (request.build_absolute_uri if request is not None
+                     else str)
+        return {
+            format_name: {
+                width: build_url(default_storage.url(name))
+                for width, name in widths.items()
+            }
+            for format_name, widths in (variants or {}).items()
+        }
@@ -1,20 +1,58 @@
 import django_filters
+from django.db.models import (BooleanField, Case, Exists, F, OuterRef, Value,
+                              When)
 from django_filters import rest_framework as filters
 
 from recipes.models import Recipe, Ingredient
+from recipes.search import search_recipes
+from .references import tag_cache
+
+
+def get_tag_ids():
+    """Словарь {slug: id} всех тегов из tag_cache."""
+    return {tag['slug']: pk for pk, tag in tag_cache.all().items()}
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class RecipeFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(field_name='name',
                                      lookup_expr='icontains')
-    tags = django_filters.AllValuesMultipleFilter(field_name='tags__slug')
+    search = django_filters.CharFilter(method='filter_search')
+    ordering = django_filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='filter_ordering')
+    tags = django_filters.MultipleChoiceFilter(choices=tag_choices,
+                                               method='filter_tags')
     author = django_filters.NumberFilter(field_name='author__id')
     is_in_shopping_cart = django_filters.BooleanFilter(
-        method='filter_is_in_shopping_cart')
+        method='filter_is_in_shopping_cart',
+        widget=django_filters.widgets.BooleanWidget())
+
+    def filter_search(self, recipes, name, value):
+        return search_recipes(recipes, value)
+
+    def filter_tags(self, recipes, name, value):
+        """
+        Рецепты хотя бы с одним из тегов.
+
+        EXISTS по промежуточной таблице вместо JOIN не размножает рецепты
+        с несколькими подходящими тегами, так что DISTINCT не нужен.
+        """
+        tag_ids = get_tag_ids()
+        return recipes.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[tag_ids[slug] for slug in value])))
+
+    def filter_ordering(self, recipes, name, value):
+        return recipes.order_by(F('ranking__score').desc(nulls_last=True),
+                                '-pub_date')
 
     def filter_is_in_shopping_cart(self, recipes, name, value):
         if value:
-            return recipes.filter(in_shopping_list_by__user=self.request.user)
+            return recipes.filter(is_in_shopping_cart=True)
         return recipes
 
     class Meta:
@@ -23,7 +61,18 @@ class RecipeFilter(django_filters.FilterSet):
 
 
 class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='icontains')
+    name = filters.CharFilter(method='filter_name')
+
+    def filter_name(self, ingredients, name, value):
+        """
+        Сначала продукты, начинающиеся с value, затем содержащие его.
+        На PostgreSQL поиск использует триграммный индекс по имени.
+        """
+        return ingredients.filter(name__icontains=value).annotate(
+            is_prefix=Case(When(name__istartswith=value, then=Value(True)),
+                           default=Value(False),
+                           output_field=BooleanField()),
+        ).order_by('-is_prefix', 'name')
 
     class Meta:
         model = Ingredient
@@ -0,0 +1,108 @@
+import tempfile
+from dataclasses import asdict, fields
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from api.benchmark import (BASELINE_PATH, SCENARIOS, build_context, compare,
+                           load_baseline, measure, save_baseline)
+from recipes.fake_data import FakeDataConfig, generate
+
+
+class Command(BaseCommand):
+    help = ('Замер числа запросов, задержки и памяти по эндпоинтам API '
+            'на синтетических данных в отдельной тестовой базе')
+
+    def add_arguments(self, parser):
+        for field in fields(FakeDataConfig):
+            parser.add_argument(f'--{field.name}',
+                                type=type(field.default),
+                                default=field.default)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Повторов для замера задержки')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO',
+                            help='Выполнить только указанные сценарии')
+        parser.add_argument('--baseline', default=BASELINE_PATH,
+                            help='Файл базовых значений')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Записать результаты как базовые')
+        parser.add_argument('--threshold', type=float, default=1.0,
+                            help='Допустимый рост p50 и памяти, доля')
+        parser.add_argument('--skip-latency', action='store_true',
+                            help='Не сравнивать задержки (другая машина)')
+
+    def handle(self, *args, **options):
+        config = FakeDataConfig(**{field.name: options[field.name]
+                                   for field in fields(FakeDataConfig)})
+        only = options['only']
+        scenarios = [scenario for scenario in SCENARIOS
+                     if not only or scenario.name in only]
+        params = {**asdict(config), 'database': connection.vendor}
+        baseline = load_baseline(options['baseline'])
+        if (baseline and not options['update_baseline']
+                and baseline['config'] != params):
+            raise CommandError(
+                'Базовые значения сняты на других данных: '
+                f'{baseline["config"]}. Укажите те же параметры или '
+                '--update-baseline.')
+
+        results, warnings = self.run(config, scenarios, options['repeat'])
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:32} запросов {result["queries"]:3}  '
+                f'p50 {result["p50_ms"]:8.2f} мс  '
+                f'p95 {result["p95_ms"]:8.2f} мс  '
+                f'p99 {result["p99_ms"]:8.2f} мс  '
+                f'память {result["alloc_kb"]:9.1f} КБ')
+        for name, warning in warnings.items():
+            self.stderr.write(self.style.WARNING(f'{name}: {warning}'))
+
+        if options['update_baseline']:
+            scenarios_baseline = (baseline or {}).get('scenarios', {})
+            if options['only'] and baseline and baseline['config'] == params:
+                results = {**scenarios_baseline, **results}
+            save_baseline({'config': params, 'scenarios': results},
+                          options['baseline'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовые значения записаны в {options["baseline"]}'))
+            return
+        if baseline is None:
+            self.stdout.write('Базовых значений нет, сравнение пропущено')
+            return
+        regressions = compare(results, baseline['scenarios'],
+                              options['threshold'],
+                              not options['skip_latency'])
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def run(self, config, scenarios, repeat):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(
+                        CACHES={'default': {
+                            'BACKEND': 'django.core.cache.backends.locmem.'
+                                       'LocMemCache'}},
+                        PASSWORD_HASHERS=[
+                            'django.contrib.auth.hashers.MD5PasswordHasher'],
+                        MEDIA_ROOT=media_root,
+                        IMAGE_VARIANTS_ASYNC=False,
+                        DEBUG=False):
+                self.stdout.write(f'Генерация данных: {asdict(config)}')
+                generate(config)
+                ctx = build_context()
+                results, warnings = {}, {}
+                for scenario in scenarios:
+                    results[scenario.name], warning = measure(
+                        scenario, ctx, repeat)
+                    if warning:
+                        warnings[scenario.name] = warning
+                return results, warnings
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
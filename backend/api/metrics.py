@@ -0,0 +1,223 @@
+"""
+Метрики запросов для работы под реальной нагрузкой.
+
+RequestMetricsMiddleware для каждого запроса считает число SQL-запросов и
+время в базе (через execute_wrapper соединения, без DEBUG), время
+сериализации и общее время. Результат отдаётся в заголовке Server-Timing
+при DEBUG, запросам из внутренних сетей и администраторам (как и
+/api/metrics/), медленные запросы пишутся в журнал вместе с их SQL, а
+агрегаты по действиям представлений (RecipeViewSet.list,
+UserViewSet.subscribe и т. п.) копятся в памяти процесса и отдаются в
+формате Prometheus на /api/metrics/. У каждого процесса gunicorn свои
+агрегаты.
+"""
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+
+from .permissions import is_internal_or_admin
+
+logger = logging.getLogger(__name__)
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+# Границы гистограммы общего времени запроса, секунды.
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+@dataclass
+class RequestMetrics:
+    """Замеры одного запроса, время в секундах."""
+
+    view: str = 'unresolved'
+    queries: int = 0
+    db_time: float = 0
+    serializer_time: float = 0
+    serializer_depth: int = 0
+    sql: list = field(default_factory=list)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if len(self.sql) < settings.METRICS_SLOW_SQL_LIMIT:
+                self.sql.append((elapsed, sql))
+
+
+@dataclass
+class ViewStats:
+    count: int = 0
+    duration: float = 0
+    db_time: float = 0
+    serializer_time: float = 0
+    queries: int = 0
+    buckets: list = field(
+        default_factory=lambda: [0] * len(DURATION_BUCKETS))
+    statuses: dict = field(default_factory=lambda: defaultdict(int))
+
+
+class MetricsRegistry:
+    """Агрегаты по (представление, метод) в памяти процесса."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.views = defaultdict(ViewStats)
+
+    def observe(self, method, status, duration, metrics):
+        # Произвольные методы не должны плодить ряды метрик.
+        method = method if method in METHODS else 'OTHER'
+        with self.lock:
+            stats = self.views[metrics.view, method]
+            stats.count += 1
+            stats.duration += duration
+            stats.db_time += metrics.db_time
+            stats.serializer_time += metrics.serializer_time
+            stats.queries += metrics.queries
+            stats.statuses[status] += 1
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[index] += 1
+
+    def render(self):
+        """Агрегаты в текстовом формате Prometheus."""
+        with self.lock:
+            views = {key: (stats, dict(stats.statuses), list(stats.buckets))
+                     for key, stats in self.views.items()}
+        lines = [
+            '# HELP foodgram_request_duration_seconds Время обработки.',
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ]
+        for (view, method), (stats, _, buckets) in views.items():
+            labels = f'view="{view}",method="{method}"'
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'foodgram_request_duration_seconds_bucket'
+                             f'{{{labels},le="{bound}"}} {count}')
+            lines += [
+                f'foodgram_request_duration_seconds_bucket'
+                f'{{{labels},le="+Inf"}} {stats.count}',
+                f'foodgram_request_duration_seconds_sum{{{labels}}} '
+                f'{stats.duration:.6f}',
+                f'foodgram_request_duration_seconds_count{{{labels}}} '
+                f'{stats.count}',
+            ]
+        for name, attribute, help_text in (
+                ('db_seconds', 'db_time', 'Время SQL-запросов.'),
+                ('serializer_seconds', 'serializer_time',
+                 'Время сериализации.'),
+                ('queries', 'queries', 'Число SQL-запросов.')):
+            lines += [f'# HELP foodgram_request_{name}_total {help_text}',
+                      f'# TYPE foodgram_request_{name}_total counter']
+            lines += [
+                f'foodgram_request_{name}_total'
+                f'{{view="{view}",method="{method}"}} '
+                f'{getattr(stats, attribute):g}'
+                for (view, method), (stats, _, _) in views.items()]
+        lines += ['# HELP foodgram_responses_total Ответы по статусам.',
+                  '# TYPE foodgram_responses_total counter']
+        lines += [
+            f'foodgram_responses_total{{view="{view}",method="{method}",'
+            f'status="{status}"}} {count}'
+            for (view, method), (_, statuses, _) in views.items()
+            for status, count in sorted(statuses.items())]
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def view_name(view_func):
+    """Имя вида RecipeViewSet.list для функции представления."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    return cls.__name__
+
+
+class RequestMetricsMiddleware:
+    """Замеры запроса, заголовок Server-Timing и журнал медленных."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - started
+        registry.observe(request.method, response.status_code, duration,
+                         metrics)
+        if settings.SERVER_TIMING and (settings.DEBUG
+                                       or is_internal_or_admin(request)):
+            response['Server-Timing'] = (
+                f'db;dur={metrics.db_time * 1000:.1f};'
+                f'desc="{metrics.queries} queries", '
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}, '
+                f'total;dur={duration * 1000:.1f}')
+        if (duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS
+                and random.random() < settings.METRICS_SLOW_SAMPLE_RATE):
+            self.log_slow(request, response, duration, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return
+        name = view_name(view_func)
+        actions = getattr(view_func, 'actions', None)
+        if actions:
+            name = (f'{name}.'
+                    f'{actions.get(request.method.lower(), "unknown")}')
+        metrics.view = name
+
+    @staticmethod
+    def log_slow(request, response, duration, metrics):
+        sql = '\n'.join(f'  {elapsed * 1000:.1f} мс: {statement}'
+                        for elapsed, statement in metrics.sql)
+        hidden = metrics.queries - len(metrics.sql)
+        if hidden > 0:
+            sql += f'\n  … и ещё {hidden}'
+        logger.warning(
+            'Медленный запрос %s %s (%s): %d, %.1f мс, база %.1f мс '
+            '(%d запросов), сериализация %.1f мс\n%s',
+            request.method, request.get_full_path(), metrics.view,
+            response.status_code, duration * 1000, metrics.db_time * 1000,
+            metrics.queries, metrics.serializer_time * 1000, sql)
+
+
+class TimedSerializerMixin:
+    """Учитывает время to_representation в метриках текущего запроса."""
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None:
+            return super().to_representation(instance)
+        # Вложенные сериализаторы уже учтены во внешнем.
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_depth -= 1
+            if not metrics.serializer_depth:
+                metrics.serializer_time += time.perf_counter() - started
@@ -1,6 +1,278 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (LimitOffsetPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
-class FoodgramPageNumberPagination(PageNumberPagination):
+from .cache import get_version
+from .conditional import user_group
+
+
+def estimate_count(queryset):
+    """Оценка числа строк выборки по плану запроса PostgreSQL."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_count(queryset, groups=()):
+    """
+    Возвращает (количество, точно ли оно, взято ли из кэша).
+
+    Результат кэшируется по тексту запроса и версиям групп данных groups
+    (см. api.cache) на PAGINATION_COUNT_CACHE_TTL секунд: изменение данных
+    группы сразу делает кэш неактуальным. На PostgreSQL, если планировщик
+    оценивает выборку больше чем в PAGINATION_COUNT_ESTIMATE_THRESHOLD
+    строк, COUNT(*) не выполняется и отдаётся оценка.
+    """
+    sql, params = queryset.query.sql_with_params()
+    versions = [get_version(group) for group in groups]
+    key = 'api:count:' + hashlib.md5(
+        f'{sql}{params}{versions}'.encode()).hexdigest()
+    result = cache.get(key)
+    if result is not None:
+        return (*result, True)
+    if connections[queryset.db].vendor == 'postgresql':
+        estimate = estimate_count(queryset)
+        if estimate > settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+            result = (estimate, False)
+    if result is None:
+        result = (queryset.count(), True)
+    cache.set(key, result, settings.PAGINATION_COUNT_CACHE_TTL)
+    return (*result, False)
+
+
+class EstimatedPage(Page):
+    """Страница при неточном count: следующая есть и тогда, когда эта полна."""
+
+    def has_next(self):
+        return (super().has_next()
+                or len(self.object_list) >= self.paginator.per_page)
+
+
+class CountingPaginator(DjangoPaginator):
+    """Пагинатор с кэшируемым и, на больших выборках, оценочным count."""
+
+    count_is_exact = True
+    count_is_cached = False
+
+    def __init__(self, *args, count_groups=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_groups = count_groups
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        count, self.count_is_exact, self.count_is_cached = get_count(
+            self.object_list, self.count_groups)
+        return count
+
+    @property
+    def count_is_reliable(self):
+        """Можно ли по count обрезать страницы: оценка и кэш могли устареть."""
+        return self.count_is_exact and not self.count_is_cached
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Оценка или кэш могли оказаться меньше реального числа строк.
+            if self.count_is_reliable or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_is_reliable:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return EstimatedPage(self.object_list[bottom:bottom + self.per_page],
+                             number, self)
+
+
+class KeysetPaginationMixin:
+    """
+    Пагинация по ключу (курсору), включаемая параметром ?cursor=.
+
+    Страница выбирается условием по паре полей keyset (второе поле —
+    уникальный id) вместо OFFSET и без COUNT(*), поэтому глубокие страницы
+    отдаются так же быстро, как первая. Пустой cursor — первая страница,
+    дальше клиент переходит по ссылкам next/previous. В ответе те же ключи,
+    что и у обычной пагинации, но count равен null.
+
+    Курсор задаёт место только в порядке keyset, поэтому с другой
+    сортировкой (?ordering=, поиск, популярное) запрос с ?cursor=
+    отклоняется, а не отдаётся молча в порядке keyset.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор.'
+    unsupported_ordering_message = (
+        'Курсор не поддерживается для выбранной сортировки, используйте '
+        'постраничную навигацию.')
+    keyset = ()
+    keyset_page_size = 6
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = (
+            bool(self.keyset)
+            and self.cursor_query_param in request.query_params)
+        if not self.keyset_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        if not self.is_keyset_ordered(queryset):
+            raise ValidationError(
+                {self.cursor_query_param: self.unsupported_ordering_message})
+        page_size = self.get_keyset_page_size(request)
+        reverse, position = self.decode_cursor(
+            request.query_params[self.cursor_query_param], queryset.model)
+
+        ordering = self.keyset
+        if reverse:
+            ordering = tuple(self._invert(field) for field in ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+        page = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+
+        self.next_position = self.previous_position = None
+        if page:
+            if has_more or reverse:
+                self.next_position = self._position(page[-1])
+            if (has_more and reverse) or (position is not None
+                                          and not reverse):
+                self.previous_position = self._position(page[0])
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': None,
+            'next': self.encode_cursor(False, self.next_position),
+            'previous': self.encode_cursor(True, self.previous_position),
+            'results': data,
+        })
+
+    def get_keyset_page_size(self, request):
+        return self.keyset_page_size
+
+    def is_keyset_ordered(self, queryset):
+        """Совпадает ли сортировка выборки с началом keyset."""
+        query = queryset.query
+        if query.extra_order_by:
+            return False
+        ordering = query.order_by or (
+            query.default_ordering and queryset.model._meta.ordering or ())
+        return (all(isinstance(field, str) for field in ordering)
+                and tuple(ordering) == self.keyset[:len(ordering)])
+
+    def encode_cursor(self, reverse, position):
+        if position is None:
+            return None
+        token = base64.urlsafe_b64encode(json.dumps([
+            int(reverse),
+            # isoformat() без усечения микросекунд, иначе ключ «съедет».
+            *(value.isoformat() if hasattr(value, 'isoformat') else value
+              for value in position),
+        ]).encode())
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param, token.decode())
+
+    def decode_cursor(self, token, model):
+        if not token:
+            return False, None
+        try:
+            reverse, *values = json.loads(base64.urlsafe_b64decode(token))
+            fields = [model._meta.get_field(field.lstrip('-'))
+                      for field in self.keyset]
+            if len(values) != len(fields):
+                raise ValueError
+            return bool(reverse), [field.to_python(value)
+                                   for field, value in zip(fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _position(self, instance):
+        return [getattr(instance, field.lstrip('-')) for field in self.keyset]
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """Условие «строго после position» для сортировки ordering."""
+        (first, second), (first_value, second_value) = ordering, position
+        first_lookup = 'lt' if first.startswith('-') else 'gt'
+        second_lookup = 'lt' if second.startswith('-') else 'gt'
+        first, second = first.lstrip('-'), second.lstrip('-')
+        return (Q(**{f'{first}__{first_lookup}': first_value})
+                | Q(**{first: first_value,
+                       f'{second}__{second_lookup}': second_value}))
+
+
+class FoodgramPageNumberPagination(KeysetPaginationMixin,
+                                   PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    keyset = ('-pub_date', '-id')
+    count_groups = ('recipes',)
+
+    @property
+    def django_paginator_class(self):
+        # PageNumberPagination создаёт пагинатор вызовом
+        # django_paginator_class(queryset, page_size), уже запомнив request.
+        return self.get_paginator
+
+    def get_paginator(self, queryset, page_size):
+        return CountingPaginator(queryset, page_size,
+                                 count_groups=self.get_count_groups())
+
+    def get_count_groups(self):
+        groups = list(self.count_groups)
+        if self.request.user.is_authenticated:
+            # Фильтры избранного и корзины зависят от связей пользователя.
+            groups.append(user_group(self.request.user.id))
+        return groups
+
+    def get_keyset_page_size(self, request):
+        return self.get_page_size(request)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if not self.keyset_mode:
+            # Точное ли число или оценка планировщика, и взято ли оно из
+            # кэша (тогда могло устареть, даже если считалось точно).
+            paginator = self.page.paginator
+            response.data['count_is_exact'] = paginator.count_is_exact
+            response.data['count_is_cached'] = paginator.count_is_cached
+        return response
+
+
+class FoodgramLimitOffsetPagination(KeysetPaginationMixin,
+                                    LimitOffsetPagination):
+    keyset = ('username', 'id')
+
+    def get_keyset_page_size(self, request):
+        return self.get_limit(request) or self.keyset_page_size
@@ -1,3 +1,6 @@
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -5,5 +8,41 @@ class IsAuthorOrReadOnlyPermission(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         return (
-            request.method in
-            permissions.SAFE_METHODS and obj.author == request.user)
+            request.method in permissions.SAFE_METHODS
+            or getattr(obj, 'author', None) == request.user)
+
+
+def client_address(request):
+    """
+    Адрес клиента. За nginx REMOTE_ADDR — адрес прокси из внутренней сети,
+    а адрес клиента прокси передаёт в X-Real-IP.
+    """
+    address = request.META.get('REMOTE_ADDR', '')
+    forwarded = request.META.get('HTTP_X_REAL_IP')
+    if forwarded and is_internal_address(address):
+        return forwarded
+    return address
+
+
+def is_internal_address(address):
+    try:
+        address = ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ip_network(network)
+               for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def is_internal_or_admin(request):
+    """Запрос из внутренних сетей (METRICS_ALLOWED_NETWORKS) или админа."""
+    if is_internal_address(client_address(request)):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_staff)
+
+
+class IsInternalOrAdmin(permissions.BasePermission):
+    """Доступ из внутренних сетей (METRICS_ALLOWED_NETWORKS) или админу."""
+
+    def has_permission(self, request, view):
+        return is_internal_or_admin(request)
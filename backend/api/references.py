@@ -0,0 +1,175 @@
+"""
+Справочники (теги и продукты) в памяти процесса.
+
+Теги и продукты читаются при каждой сериализации и проверке рецепта, а
+меняются редко. ReferenceCache держит {id: поля} модели в памяти и
+сверяет свою версию с версией группы кэша ответов (см. api.cache) не
+чаще раза в VERSION_CHECK_INTERVAL секунд: сигналы меняют версию группы
+после фиксации транзакции, и другие процессы gunicorn подхватывают
+изменения через общий кэш. Без общего кэша (LocMemCache) данные
+перечитываются не реже чем раз в REFERENCE_TTL секунд.
+"""
+import threading
+import time
+from functools import wraps
+
+from django.db import IntegrityError, router
+from rest_framework import serializers
+
+from recipes.models import Ingredient, Tag
+from .cache import get_version
+
+STALE_REFERENCES_MESSAGE = ('Теги или ингредиенты рецепта были удалены, '
+                            'обновите их список.')
+# SQLSTATE нарушения внешнего ключа в PostgreSQL.
+FOREIGN_KEY_VIOLATION = '23503'
+
+REFERENCE_TTL = 300
+VERSION_CHECK_INTERVAL = 1
+# Сколько отсутствующих в базе id помнить между перезагрузками.
+MAX_ABSENT = 10000
+
+
+class ReferenceCache:
+    """
+    Словарь {id: {поле: значение}} модели с проверкой версии группы.
+
+    Словарь после публикации не меняется: дочитанные объекты попадают в
+    его копию, поэтому читатели могут обходить all() без блокировки.
+    generation растёт при каждой полной перезагрузке, в пределах одного
+    поколения словари только дополняются.
+    """
+
+    def __init__(self, model, fields, group, ttl=REFERENCE_TTL,
+                 check_interval=VERSION_CHECK_INTERVAL):
+        self.model = model
+        self.fields = fields
+        self.group = group
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._items = None
+        self._absent = frozenset()
+        self._version = None
+        self.generation = 0
+        self._loaded_at = 0
+        self._checked_at = 0
+
+    def __deepcopy__(self, memo):
+        # Поля сериализаторов копируются с аргументами, а кэш у процесса
+        # один.
+        return self
+
+    def invalidate(self):
+        self._items = None
+
+    def _load(self):
+        items = self._items
+        now = time.monotonic()
+        if items is not None and now - self._checked_at < self.check_interval:
+            return items
+        version = get_version(self.group)
+        with self._lock:
+            if (self._items is not None and self._version == version
+                    and now - self._loaded_at < self.ttl):
+                self._checked_at = now
+                return self._items
+            self._items = {
+                item['id']: item
+                for item in self.model.objects.values('id', *self.fields)
+            }
+            self._absent = frozenset()
+            self.generation += 1
+            self._version = version
+            self._loaded_at = self._checked_at = time.monotonic()
+            return self._items
+
+    def all(self):
+        return self._load()
+
+    def get_many(self, pks):
+        """
+        {id: поля} для тех pks, что есть в базе. Менять поля нельзя.
+
+        Объект мог появиться в другом процессе до смены версии, поэтому
+        недостающие в кэше id дочитываются одним запросом, а отсутствующие
+        в базе запоминаются до следующей перезагрузки.
+        """
+        items = self._load()
+        missing = {pk for pk in pks
+                   if pk not in items and pk not in self._absent}
+        if missing:
+            loaded = {item['id']: item for item in self.model.objects.filter(
+                pk__in=missing).values('id', *self.fields)}
+            items = {**items, **loaded}
+            with self._lock:
+                if loaded and self._items is not None:
+                    self._items = {**self._items, **loaded}
+                absent = self._absent
+                if len(absent) > MAX_ABSENT:
+                    absent = frozenset()
+                self._absent = absent | (missing - loaded.keys())
+        return {pk: items[pk] for pk in pks if pk in items}
+
+    def get(self, pk):
+        """Поля объекта или None, если его нет. Менять их нельзя."""
+        return self.get_many([pk]).get(pk)
+
+    def instance(self, pk):
+        """Экземпляр модели из кэша, как загруженный из базы, или None."""
+        values = self.get(pk)
+        if values is None:
+            return None
+        return self.model.from_db(router.db_for_read(self.model),
+                                  list(values), list(values.values()))
+
+
+tag_cache = ReferenceCache(Tag, ('name', 'slug'), 'tags')
+ingredient_cache = ReferenceCache(Ingredient, ('name', 'measurement_unit'),
+                                  'ingredients')
+
+
+def is_foreign_key_violation(error):
+    return (getattr(error.__cause__, 'pgcode', None) == FOREIGN_KEY_VIOLATION
+            or 'FOREIGN KEY constraint failed' in str(error))
+
+
+def references_checked(method):
+    """
+    Превращает нарушение внешнего ключа при фиксации в ответ 400.
+
+    Оборачивает метод с transaction.atomic: внешние ключи проверяются при
+    фиксации, и тег или продукт, удалённый другим процессом уже после
+    проверки в сериализаторе, иначе дал бы ответ 500.
+    """
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except IntegrityError as error:
+            if not is_foreign_key_violation(error):
+                raise
+            tag_cache.invalidate()
+            ingredient_cache.invalidate()
+            raise serializers.ValidationError(STALE_REFERENCES_MESSAGE)
+    return wrapper
+
+
+class ReferencePrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """Связь по id, проверяемая по ReferenceCache без запроса к базе."""
+
+    def __init__(self, reference, **kwargs):
+        self.reference = reference
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        instance = self.reference.instance(pk)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
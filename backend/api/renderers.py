@@ -0,0 +1,321 @@
+import csv
+import zlib
+from functools import lru_cache
+from io import BytesIO
+from itertools import chain, islice
+
+from django.conf import settings
+from fontTools.subset import Options, Subsetter
+from fontTools.ttLib import TTFont
+from rest_framework import renderers
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from .utils import render_shopping_list
+
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+PDF_TEXT_WIDTH = PDF_PAGE_WIDTH - 2 * PDF_MARGIN
+PDF_FONT_SIZE = 11
+PDF_LEADING = 14
+PDF_LINES_PER_PAGE = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+# Имя шрифта в документе с префиксом, обязательным для подмножеств.
+PDF_FONT_NAME = b'AAAAAA+Shopping'
+# Символы подмножества шрифта, которое готовится один раз на процесс и
+# встраивается в документы только из них (почти любой список покупок).
+PDF_BASE_CODES = frozenset(chain(
+    range(0x20, 0x7F), range(0xA0, 0x100), range(0x400, 0x460),
+    map(ord, '–—‘’‚“”„…№€')))
+
+
+class FallbackContentNegotiation(DefaultContentNegotiation):
+    """
+    Выбор рендерера, при неподходящем Accept — первый из списка.
+
+    Клиенты, присылающие Accept: application/json, получают файл, а не
+    ответ 406. Явно запрошенный неизвестный ?format= по-прежнему ошибка.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            if format_suffix or request.query_params.get(
+                    self.settings.URL_FORMAT_OVERRIDE):
+                raise
+            return renderers[0], renderers[0].media_type
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+
+    Документ отдаётся по частям через stream(), чтобы размер корзины не
+    влиял на расход памяти. render() используется DRF только для ответов
+    с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = data.values()
+        return b''.join(self.render_lines(str(item) for item in data))
+
+    def stream(self, ingredients, recipes):
+        return self.render_lines(render_shopping_list(ingredients, recipes))
+
+    def render_lines(self, lines):
+        """По умолчанию — строки текста в кодировке charset."""
+        for line in lines:
+            yield f'{line}\n'.encode(self.charset)
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients, recipes):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('№', 'Продукт', 'Количество', 'Единица измерения')
+        ).encode(self.charset)
+        for index, ingredient in enumerate(ingredients, 1):
+            yield writer.writerow((
+                index,
+                ingredient['ingredient__name'],
+                ingredient['total_amount'],
+                ingredient['ingredient__measurement_unit'],
+            )).encode(self.charset)
+
+    def render_lines(self, lines):
+        writer = csv.writer(Echo())
+        for line in lines:
+            yield writer.writerow((line,)).encode(self.charset)
+
+
+class PDFFont:
+    """
+    Шрифт для PDF: метрики читаются fontTools один раз на процесс.
+
+    В документ встраивается подмножество глифов с прежними номерами:
+    заранее готовое для PDF_BASE_CODES или, если в документе есть другие
+    символы, урезанное до использованных.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = file.read()
+        font = TTFont(BytesIO(self.data), lazy=True)
+        head, hhea = font['head'], font['hhea']
+        self.units_per_em = head.unitsPerEm
+        self.bbox = [self.scale(value) for value in (
+            head.xMin, head.yMin, head.xMax, head.yMax)]
+        self.ascent = self.scale(hhea.ascent)
+        self.descent = self.scale(hhea.descent)
+        self.cap_height = self.scale(
+            getattr(font['OS/2'], 'sCapHeight', 0) or hhea.ascent)
+        glyph_ids = font.getReverseGlyphMap()
+        metrics = font['hmtx'].metrics
+        self.glyphs = {code: glyph_ids[name]
+                       for code, name in font.getBestCmap().items()}
+        self.widths = {glyph_ids[name]: self.scale(metrics[name][0])
+                       for name in ('.notdef', *font.getBestCmap().values())}
+        base = self._subset(self.data, PDF_BASE_CODES)
+        self.base = zlib.compress(base), len(base)
+
+    def scale(self, value):
+        return round(value * 1000 / self.units_per_em)
+
+    def text_width(self, text, size):
+        return sum(self.widths[self.glyphs.get(ord(char), 0)]
+                   for char in text) * size / 1000
+
+    def font_file(self, codes):
+        """Сжатый файл шрифта с глифами символов codes и его размер."""
+        if codes <= PDF_BASE_CODES:
+            return self.base
+        data = self._subset(self.data, codes)
+        return zlib.compress(data), len(data)
+
+    @staticmethod
+    def _subset(data, codes):
+        options = Options()
+        options.retain_gids = True
+        options.hinting = False
+        options.layout_features = []
+        options.name_IDs = []
+        options.drop_tables += ['FFTM']
+        font = TTFont(BytesIO(data))
+        subsetter = Subsetter(options)
+        subsetter.populate(unicodes=codes)
+        subsetter.subset(font)
+        buffer = BytesIO()
+        font.save(buffer)
+        return buffer.getvalue()
+
+
+@lru_cache(maxsize=None)
+def load_pdf_font(path):
+    return PDFFont(path)
+
+
+def wrap_line(font, line, width=PDF_TEXT_WIDTH, size=PDF_FONT_SIZE):
+    """Разбивает строку по словам на части не шире width пунктов."""
+    parts = []
+    current = ''
+    for word in line.split(' '):
+        candidate = f'{current} {word}' if current else word
+        if font.text_width(candidate, size) <= width:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        # Слово длиннее строки режется по символам.
+        current = ''
+        for char in word:
+            if current and font.text_width(current + char, size) > width:
+                parts.append(current)
+                current = ''
+            current += char
+    parts.append(current)
+    return parts
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """
+    Минимальный потоковый PDF.
+
+    Шрифт с кириллицей (SHOPPING_LIST_PDF_FONT, по умолчанию DejaVu Sans из
+    системного пакета) встраивается как CID-шрифт с кодировкой Identity-H:
+    текст записывается номерами глифов. Длинные строки переносятся по
+    словам. Страницы пишутся по мере поступления строк, а подмножество
+    шрифта с использованными глифами, их ширины и ToUnicode — в конце,
+    таблица xref собирается из смещений.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def render_lines(self, lines):
+        font = load_pdf_font(settings.SHOPPING_LIST_PDF_FONT)
+        lines = iter(chain.from_iterable(
+            wrap_line(font, line) for line in lines))
+        used = {}
+        offsets = {}
+        position = 0
+
+        def write(number, body):
+            nonlocal position
+            offsets[number] = position
+            chunk = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+            position += len(chunk)
+            return chunk
+
+        def write_stream(number, data, extra=b''):
+            return write(number, b'<< /Length %d%s >>\nstream\n%s\nendstream'
+                         % (len(data), extra, data))
+
+        header = b'%PDF-1.4\n'
+        position += len(header)
+        yield header
+        yield write(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+        pages = []
+        number = 8
+        while True:
+            page_lines = list(islice(lines, PDF_LINES_PER_PAGE))
+            if not page_lines and pages:
+                break
+            yield write_stream(
+                number, self._page_content(font, used, page_lines))
+            yield write(number + 1, (
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d]'
+                b' /Resources << /Font << /F1 3 0 R >> >>'
+                b' /Contents %d 0 R >>'
+                % (PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT, number)))
+            pages.append(number + 1)
+            number += 2
+
+        glyphs = sorted(used)
+        yield write(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % page for page in pages), len(pages)))
+        yield write(3, b'<< /Type /Font /Subtype /Type0 /BaseFont /%s'
+                       b' /Encoding /Identity-H /DescendantFonts [4 0 R]'
+                       b' /ToUnicode 5 0 R >>' % PDF_FONT_NAME)
+        yield write(4, (
+            b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s'
+            b' /CIDSystemInfo << /Registry (Adobe) /Ordering (Identity)'
+            b' /Supplement 0 >> /FontDescriptor 6 0 R'
+            b' /CIDToGIDMap /Identity /DW %d /W [%s] >>'
+            % (PDF_FONT_NAME, font.widths[0], b' '.join(
+                b'%d [%d]' % (glyph, font.widths[glyph])
+                for glyph in glyphs))))
+        yield write_stream(5, self._to_unicode(used, glyphs))
+        yield write(6, (
+            b'<< /Type /FontDescriptor /FontName /%s /Flags 32'
+            b' /FontBBox [%s] /ItalicAngle 0 /Ascent %d /Descent %d'
+            b' /CapHeight %d /StemV 80 /FontFile2 7 0 R >>'
+            % (PDF_FONT_NAME, b' '.join(b'%d' % value for value in font.bbox),
+               font.ascent, font.descent, font.cap_height)))
+        font_file, length = font.font_file(set(map(ord, used.values())))
+        yield write_stream(7, font_file,
+                           b' /Length1 %d /Filter /FlateDecode' % length)
+        xref = [b'xref\n0 %d\n' % number, b'0000000000 65535 f \n']
+        xref.extend(b'%010d 00000 n \n' % offsets[index]
+                    for index in range(1, number))
+        yield b''.join(xref)
+        yield (b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+               % (number, position))
+
+    @staticmethod
+    def _to_unicode(used, glyphs):
+        """CMap глиф → символ, чтобы из PDF копировался и искался текст."""
+        blocks = []
+        for start in range(0, len(glyphs), 100):
+            chunk = glyphs[start:start + 100]
+            blocks.append(b'%d beginbfchar\n%s\nendbfchar' % (
+                len(chunk), b'\n'.join(
+                    b'<%04X> <%s>' % (glyph,
+                                      used[glyph].encode('utf-16-be').hex()
+                                      .upper().encode())
+                    for glyph in chunk)))
+        return (
+            b'/CIDInit /ProcSet findresource begin\n12 dict begin\n'
+            b'begincmap\n/CIDSystemInfo << /Registry (Adobe)'
+            b' /Ordering (UCS) /Supplement 0 >> def\n'
+            b'/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+            b'1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+            b'%s\nendcmap\nCMapName currentdict /CMap defineresource pop\n'
+            b'end\nend' % b'\n'.join(blocks))
+
+    @staticmethod
+    def _encode(font, used, line):
+        glyphs = []
+        for char in line:
+            glyph = font.glyphs.get(ord(char), 0)
+            if glyph:
+                used.setdefault(glyph, char)
+            glyphs.append(glyph)
+        return b''.join(b'%04X' % glyph for glyph in glyphs)
+
+    def _page_content(self, font, used, lines):
+        return b'BT /F1 %d Tf %d TL %d %d Td %s ET' % (
+            PDF_FONT_SIZE, PDF_LEADING, PDF_MARGIN,
+            PDF_PAGE_HEIGHT - PDF_MARGIN,
+            b' '.join(b'<%s> Tj T*' % self._encode(font, used, line)
+                      for line in lines))
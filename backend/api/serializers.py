@@ -1,25 +1,36 @@
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
+from django.db import transaction
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
 
-from api.fields import Base64ImageField
+from api.fields import Base64ImageField, ImageVariantsField
+from api.metrics import TimedSerializerMixin
+from api.references import (STALE_REFERENCES_MESSAGE,
+                            ReferencePrimaryKeyField, ingredient_cache,
+                            tag_cache)
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag, Follow)
+                            ShoppingCart, ShoppingListItem, Tag, Follow)
 
 User = get_user_model()
 
+# Сколько id можно передать в одном массовом действии.
+BULK_MAX_IDS = 100
 
-class UserSerializer(DjoserUserSerializer):
+
+class UserSerializer(TimedSerializerMixin, DjoserUserSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField()
 
     class Meta(DjoserUserSerializer.Meta):
         model = User
         fields = DjoserUserSerializer.Meta.fields + ('is_subscribed',
                                                      'first_name', 'last_name',
-                                                     'avatar')
+                                                     'avatar',
+                                                     'avatar_variants')
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             user_id = request.user.id
@@ -28,7 +39,8 @@ class UserSerializer(DjoserUserSerializer):
         return False
 
 
-class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
+class RecipeIngredientCreateSerializer(TimedSerializerMixin,
+                                       serializers.ModelSerializer):
     id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
@@ -47,36 +59,44 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
             }
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
 
-class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.ReadOnlyField(source='ingredient.id')
-    name = serializers.ReadOnlyField(source='ingredient.name')
-    measurement_unit = serializers.ReadOnlyField(
-        source='ingredient.measurement_unit'
-    )
+class RecipeIngredientSerializer(TimedSerializerMixin,
+                                 serializers.ModelSerializer):
+    """Продукт рецепта: название и единица берутся из ingredient_cache."""
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount', 'name', 'measurement_unit',)
 
-
-class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        # Продукт мог быть удалён после выборки рецепта.
+        ingredient = ingredient_cache.get(instance.ingredient_id) or {}
+        return {
+            'id': instance.ingredient_id,
+            'amount': instance.amount,
+            'name': ingredient.get('name'),
+            'measurement_unit': ingredient.get('measurement_unit'),
+        }
+
+
+class RecipeCreateUpdateSerializer(TimedSerializerMixin,
+                                   serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
+    tags = ReferencePrimaryKeyField(reference=tag_cache,
+                                    queryset=Tag.objects.all(), many=True)
     id = serializers.ReadOnlyField()
     ingredients = RecipeIngredientCreateSerializer(many=True)
     image = Base64ImageField()
@@ -89,89 +109,178 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             'tags', 'cooking_time', 'pub_date',
         )
 
-    def tags_and_ingredients_set(self, recipe, tags, ingredients):
-        recipe.tags.set(tags)
-        RecipeIngredient.objects.bulk_create(RecipeIngredient(
-            recipe=recipe,
-            ingredient_id=ingredient['id'],
-            amount=ingredient['amount'])
-            for ingredient in ingredients)
+    @staticmethod
+    def check_references(tag_ids, ingredient_ids):
+        """
+        Проверяет, что только что записанные теги и продукты есть в базе.
+
+        Они проверялись по кэшу процесса, а другой процесс мог их уже
+        удалить: внешние ключи проверяются только при фиксации, поэтому
+        ошибку лучше отдать как ответ 400 сразу.
+        """
+        for model, ids, reference in ((Tag, tag_ids, tag_cache),
+                                      (Ingredient, ingredient_ids,
+                                       ingredient_cache)):
+            if ids and len(ids) != model.objects.filter(pk__in=ids).count():
+                reference.invalidate()
+                raise serializers.ValidationError(STALE_REFERENCES_MESSAGE)
+
+    @staticmethod
+    def set_tags(recipe, tags, current=None):
+        """Приводит теги рецепта к tags и возвращает id добавленных."""
+        through = Recipe.tags.through
+        if current is None:
+            current = set(through.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True))
+        new = {tag.id for tag in tags}
+        if current - new:
+            through.objects.filter(recipe=recipe,
+                                   tag_id__in=current - new).delete()
+        added = new - current
+        if added:
+            through.objects.bulk_create(
+                through(recipe=recipe, tag_id=tag_id) for tag_id in added)
+        return added
 
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         validated_data.pop('author', None)
-        self._validate_tags_and_ingredients(tags, ingredients)
         recipe = Recipe.objects.create(author=self.context['request'].user,
                                        **validated_data)
-        self.tags_and_ingredients_set(recipe, tags, ingredients)
+        self.set_tags(recipe, tags, current=set())
+        RecipeIngredient.objects.bulk_create(RecipeIngredient(
+            recipe=recipe,
+            ingredient_id=ingredient['id'],
+            amount=ingredient['amount'])
+            for ingredient in ingredients)
+        self.check_references(
+            {tag.id for tag in tags},
+            {ingredient['id'] for ingredient in ingredients})
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags_data = validated_data.pop('tags', None)
         ingredients_data = validated_data.pop('ingredients', None)
-        self._validate_tags_and_ingredients(tags_data, ingredients_data)
-        if ingredients_data:
-            instance.ingredients.clear()
-
-        self.tags_and_ingredients_set(instance,
-                                      tags_data or instance.tags.all(),
-                                      ingredients_data)
+        added_tags = added_ingredients = ()
+        if tags_data is not None:
+            added_tags = self.set_tags(instance, tags_data)
+        if ingredients_data is not None:
+            old_amounts, new_amounts = self.update_ingredients(
+                instance, ingredients_data)
+            added_ingredients = new_amounts.keys() - old_amounts.keys()
+            ShoppingListItem.objects.update_recipe(instance, old_amounts,
+                                                   new_amounts)
+        self.check_references(added_tags, added_ingredients)
         return super().update(instance, validated_data)
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """
+        Приводит продукты рецепта к ingredients, меняя только отличия.
+
+        Возвращает прежний состав оставшихся строк и новый состав
+        {id продукта: количество}. Удалённые строки вычитает из списков
+        покупок сигнал post_delete.
+        """
+        new_amounts = {item['id']: item['amount'] for item in ingredients}
+        current = {}
+        deleted = []
+        for item in RecipeIngredient.objects.filter(recipe=recipe):
+            if (item.ingredient_id in current
+                    or item.ingredient_id not in new_amounts):
+                deleted.append(item.pk)
+            else:
+                current[item.ingredient_id] = item
+        old_amounts = {ingredient_id: item.amount
+                       for ingredient_id, item in current.items()}
+        changed = []
+        for ingredient_id, item in current.items():
+            if item.amount != new_amounts[ingredient_id]:
+                item.amount = new_amounts[ingredient_id]
+                changed.append(item)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if deleted:
+            RecipeIngredient.objects.filter(pk__in=deleted).delete()
+        return old_amounts, new_amounts
+
     def validate_unique_items(self, items, error_message):
         unique_items = set(items)
         if len(unique_items) != len(items):
-            raise ValidationError(error_message)
+            raise serializers.ValidationError(error_message)
+
+    def validate_tags(self, tags):
+        self.validate_unique_items(tags, 'Теги не должны повторяться.')
+        return tags
 
-    def _validate_tags_and_ingredients(self, tags, ingredients):
-        """Проверка на уникальность тегов и ингредиентов."""
-        if tags:
-            self.validate_unique_items(tags, 'Теги не должны повторяться.')
-        if ingredients:
-            self.validate_unique_items(
-                [ingredient['id'] for ingredient in ingredients],
-                'Ингредиенты не должны повторяться.'
-            )
+    def validate_ingredients(self, ingredients):
+        """Уникальность и существование продуктов по ingredient_cache."""
+        ids = [ingredient['id'] for ingredient in ingredients]
+        self.validate_unique_items(ids, 'Ингредиенты не должны повторяться.')
+        missing = set(ids) - ingredient_cache.get_many(ids).keys()
+        if missing:
+            raise serializers.ValidationError(
+                'Нет ингредиентов с id: '
+                + ', '.join(map(str, sorted(missing))))
+        return ingredients
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
-    tags = TagSerializer(many=True)
+    tags = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = ('search_vector', 'favorites_count', 'shopping_cart_count')
+
+    def get_tags(self, recipe):
+        """Теги из tag_cache, у подгруженных тегов достаточно id."""
+        tags = tag_cache.get_many([tag.id for tag in recipe.tags.all()])
+        return list(tags.values())
 
     def get_ingredients(self, recipe):
-        ingredients = RecipeIngredient.objects.filter(recipe=recipe)
-        return RecipeIngredientSerializer(ingredients, many=True).data
+        items = recipe.recipe_ingredients.all()
+        # Продукты, которых нет в кэше, дочитываются одним запросом.
+        ingredient_cache.get_many([item.ingredient_id for item in items])
+        return RecipeIngredientSerializer(items, many=True).data
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and Favorite.objects.filter(
                     user=request.user.id, recipe=recipe.id).exists())
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and ShoppingCart.objects.filter(
                     user=request.user.id, recipe=recipe.id).exists())
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
 
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField(
         read_only=True
@@ -185,30 +294,19 @@ class FollowSerializer(serializers.ModelSerializer):
                   'is_subscribed')
 
     def get_recipes(self, author):
-
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        try:
-            limit = int(limit)
-            if limit < 0:
-                raise ValidationError(
-                    'Параметр "recipes_limit" должен быть положительным'
-                    'числом.')
-        except ValueError:
-            raise ValidationError(
-                'Параметр "recipes_limit" должен быть целым числом.')
-
-        recipes = author.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(author, 'recipes_preview'):
+            recipes = author.recipes_preview
+        else:
+            recipes = author.recipes.all()[:self.context.get('recipes_limit')]
         return RecipeShortSerializer(recipes, many=True).data
 
     @staticmethod
     def get_recipes_count(author):
-
-        return author.recipes.count()
+        return author.recipes_count
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             user_id = request.user.id
@@ -217,9 +315,22 @@ class FollowSerializer(serializers.ModelSerializer):
         return False
 
 
-class AvatarSerializer(serializers.ModelSerializer):
+class AvatarSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     avatar = Base64ImageField()
 
     class Meta:
         model = User
         fields = ('avatar', )
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массовых действий, повторы отбрасываются."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
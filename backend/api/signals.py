@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from recipes.catalog import ingredients_imported
+from recipes.images import variants_updated
+from recipes.ranking import ranking_updated
+from recipes.relations import relations_changed
+from recipes.transfer import recipes_imported
+from . import cache
+from .conditional import user_group
+from .references import ingredient_cache, tag_cache
+
+User = get_user_model()
+
+# Поля пользователя, которые API отдаёт в профиле и в авторе рецепта.
+RENDERED_USER_FIELDS = ('email', 'username', 'first_name', 'last_name',
+                        'avatar', 'avatar_variants')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver(ingredients_imported)
+def invalidate_ingredient_reference(**kwargs):
+    transaction.on_commit(ingredient_cache.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_reference(**kwargs):
+    transaction.on_commit(tag_cache.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver(ingredients_imported)
+def invalidate_ingredients_cache(**kwargs):
+    cache.invalidate('ingredients', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags_cache(**kwargs):
+    cache.invalidate('tags', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(ranking_updated)
+@receiver(recipes_imported)
+@receiver(variants_updated, sender=Recipe)
+def invalidate_recipes_cache(**kwargs):
+    cache.invalidate('recipes')
+
+
+@receiver(pre_save, sender=User)
+def remember_rendered_user_fields(instance, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login, смена пароля — пароль:
+    # такие сохранения не должны сбрасывать кэш и ETag всего сайта.
+    if update_fields is not None:
+        instance._rendered_fields_changed = bool(
+            set(update_fields) & set(RENDERED_USER_FIELDS))
+        return
+    previous = User.objects.filter(pk=instance.pk).values(
+        *RENDERED_USER_FIELDS).first() if instance.pk else None
+    instance._rendered_fields_changed = previous is not None and any(
+        getattr(instance, field) != value
+        for field, value in previous.items())
+
+
+@receiver(post_save, sender=User)
+def invalidate_users_cache(instance, created, **kwargs):
+    if created:
+        # Новый пользователь ещё не автор рецептов.
+        cache.invalidate('users')
+    elif instance._rendered_fields_changed:
+        cache.invalidate('users', 'recipes')
+
+
+@receiver(post_delete, sender=User)
+@receiver(variants_updated, sender=User)
+def invalidate_users_and_recipes_cache(**kwargs):
+    cache.invalidate('users', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_user_cache(instance, **kwargs):
+    cache.invalidate(user_group(instance.user_id))
+
+
+@receiver(relations_changed)
+def invalidate_user_cache_relations(user_id, **kwargs):
+    cache.invalidate(user_group(user_id))
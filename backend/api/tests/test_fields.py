@@ -0,0 +1,75 @@
+import base64
+import io
+import tracemalloc
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from api.fields import Base64ImageField
+
+
+def png_bytes(side):
+    buffer = io.BytesIO()
+    # Шум почти не сжимается: файл большой при небольших размерах.
+    Image.frombytes('RGB', (side, side),
+                    bytes(range(256)) * (side * side * 3 // 256 + 1)
+                    ).save(buffer, 'PNG', compress_level=0)
+    return buffer.getvalue()
+
+
+def data_url(content, encode=base64.b64encode):
+    return 'data:image/png;base64,' + encode(content).decode()
+
+
+class Base64ImageFieldTest(SimpleTestCase):
+    """Декодирование картинок из data URL."""
+
+    def decode(self, data):
+        return Base64ImageField().decode(data)
+
+    def assertInvalid(self, data, code):
+        with self.assertRaises(ValidationError) as context:
+            self.decode(data)
+        self.assertEqual(context.exception.get_codes(), [code])
+
+    def test_decoded_file(self):
+        content = png_bytes(64)
+        file = self.decode(data_url(content))
+        self.assertEqual(file.content_type, 'image/png')
+        self.assertEqual(file.size, len(content))
+        self.assertEqual(file.read(), content)
+
+    def test_line_wrapped_base64(self):
+        content = png_bytes(300)
+        file = self.decode(data_url(content, base64.encodebytes))
+        self.assertEqual(file.read(), content)
+
+    def test_memory_peak_is_bounded(self):
+        content = png_bytes(1000)
+        data = data_url(content)
+        tracemalloc.start()
+        try:
+            file = self.decode(data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(file.size, len(content))
+        self.assertGreater(len(content), 2 * 2 ** 20)
+        self.assertLess(peak, 512 * 1024)
+
+    @override_settings(IMAGE_MAX_UPLOAD_SIZE=1000)
+    def test_size_cap(self):
+        self.assertInvalid(data_url(png_bytes(64)), 'too_big')
+
+    def test_malformed_input(self):
+        content = base64.b64encode(png_bytes(16)).decode()
+        for data in ('data:image/png,' + content,
+                     'data:image/png;base64,' + content[:-1],
+                     'data:image/png;base64,' + content[:40] + '!'
+                     + content[40:],
+                     'data:image/png;base64,'):
+            with self.subTest(data=data[:30]):
+                self.assertInvalid(data, 'invalid_base64')
+        self.assertInvalid(data_url(b'not an image at all'),
+                           'unknown_format')
@@ -0,0 +1,77 @@
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from recipes.images import variant_names
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+def png_file(name, color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 40), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+class ImageVariantsSignalsTest(TestCase):
+    """Копии картинки при её смене в обход API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, IMAGE_VARIANTS_ASYNC=False,
+            IMAGE_VARIANT_FORMATS=['webp'], IMAGE_VARIANT_WIDTHS=[20])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.user, name='рецепт', text='текст',
+                cooking_time=5, image=png_file('first.png', 'red'))
+        recipe.refresh_from_db()
+        return recipe
+
+    def test_changed_image_gets_new_variants(self):
+        recipe = self.create_recipe()
+        old_variants = recipe.image_variants
+        self.assertTrue(old_variants)
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        recipe.image = png_file('second.png', 'blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+            self.assertEqual(Recipe.objects.get(
+                pk=recipe.pk).image_variants, {})
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants)
+        self.assertNotEqual(recipe.image_variants, old_variants)
+        for name in variant_names(old_variants):
+            self.assertFalse(default_storage.exists(name))
+
+    def test_unchanged_image_keeps_variants(self):
+        recipe = self.create_recipe()
+        variants = recipe.image_variants
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        recipe.name = 'новое название'
+        with self.assertNumQueries(1):
+            recipe.save(update_fields=['name'])
+        recipe = Recipe.objects.only('id', 'text').get(pk=recipe.pk)
+        recipe.text = 'новый текст'
+        with self.assertNumQueries(1):
+            recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, variants)
@@ -0,0 +1,60 @@
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from recipes.models import ImportCheckpoint, Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+class ImportCheckpointTest(TestCase):
+    """Продолжение прерванного импорта рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='author',
+                                 email='author@example.com',
+                                 password='password')
+        Tag.objects.create(name='тег', slug='tag')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile('w', suffix='.ndjson',
+                                           encoding='utf-8')
+        self.addCleanup(file.close)
+        for index in range(4):
+            file.write(json.dumps({
+                'author': 'author', 'name': f'рецепт {index}',
+                'text': 'текст', 'cooking_time': 5,
+                'image': 'recipes/images/test.png', 'tags': ['tag'],
+                'ingredients': [{'name': 'соль', 'measurement_unit': 'г',
+                                 'amount': 1}],
+            }) + '\n')
+        file.flush()
+        self.path = file.name
+
+    def import_recipes(self):
+        call_command('import_recipes', self.path, batch_size=2,
+                     checkpoint='test', stdout=StringIO(),
+                     stderr=StringIO())
+
+    def test_failed_batch_is_not_skipped_or_duplicated(self):
+        with mock.patch('recipes.transfer.update_search_index',
+                        side_effect=[None, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                self.import_recipes()
+        # Пачка и точка продолжения откатываются вместе.
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertEqual(
+            ImportCheckpoint.objects.get(name='test').next_line, 2)
+
+        self.import_recipes()
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('name', flat=True)),
+            [f'рецепт {index}' for index in range(4)])
+        self.assertFalse(ImportCheckpoint.objects.exists())
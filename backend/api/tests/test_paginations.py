@@ -0,0 +1,89 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.benchmark import clear_cache
+from api.paginations import KeysetPaginationMixin
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class KeysetPaginationTest(TestCase):
+    """Пагинация рецептов по курсору."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user, name=f'рецепт {index}',
+                image='recipes/images/test.png', text='текст',
+                cooking_time=5)
+            for index in range(5)]
+
+    def setUp(self):
+        clear_cache()
+        self.client = APIClient()
+
+    def test_cursor_walks_default_ordering(self):
+        ids = []
+        url, params = '/api/recipes/', {'cursor': '', 'limit': 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(ids, [recipe.id for recipe in Recipe.objects.all()])
+
+    def test_cursor_with_other_ordering_is_rejected(self):
+        for path, params in (('/api/recipes/', {'ordering': 'popular'}),
+                             ('/api/recipes/', {'search': 'рецепт'}),
+                             ('/api/recipes/trending/', {})):
+            response = self.client.get(path, {**params, 'cursor': ''})
+            self.assertEqual(response.status_code, 400, path)
+            self.assertIn('cursor', response.data)
+
+    def test_default_keyset_page_size(self):
+        class Pagination(KeysetPaginationMixin, LimitOffsetPagination):
+            keyset = ('-pub_date', '-id')
+            keyset_page_size = 2
+
+        pagination = Pagination()
+        page = pagination.paginate_queryset(
+            Recipe.objects.all(),
+            Request(APIRequestFactory().get('/', {'cursor': ''})))
+        self.assertEqual(page, list(Recipe.objects.all()[:2]))
+        self.assertIsNotNone(pagination.next_position)
+
+
+class CountPaginationTest(TestCase):
+    """Признаки count в ответе постраничной навигации."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        for index in range(3):
+            Recipe.objects.create(
+                author=user, name=f'рецепт {index}',
+                image='recipes/images/test.png', text='текст',
+                cooking_time=5)
+
+    def setUp(self):
+        clear_cache()
+        self.client = APIClient()
+
+    def test_cached_count_stays_exact(self):
+        first = self.client.get('/api/recipes/', {'limit': 2}).data
+        second = self.client.get('/api/recipes/', {'limit': 1}).data
+        self.assertEqual((first['count'], first['count_is_exact'],
+                          first['count_is_cached']), (3, True, False))
+        self.assertEqual((second['count'], second['count_is_exact'],
+                          second['count_is_cached']), (3, True, True))
@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Tag
+
+User = get_user_model()
+
+
+class IsAuthorOrReadOnlyPermissionTest(TestCase):
+    """Чтение открыто всем, правка — только автору объекта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        cls.tag = Tag.objects.create(name='тег', slug='tag')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def test_objects_without_author_are_readable(self):
+        # У тегов и продуктов нет автора: раньше здесь был ответ 500.
+        for path in (f'/api/ingredients/{self.ingredient.id}/',
+                     f'/api/tags/{self.tag.id}/'):
+            with self.subTest(path=path):
+                self.assertEqual(APIClient().get(path).status_code, 200)
+
+    def test_objects_without_author_are_read_only(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.patch(f'/api/ingredients/{self.ingredient.id}/',
+                                {'name': 'перец'}, format='json')
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.benchmark import clear_cache
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+
+User = get_user_model()
+
+PAGE_SIZES = (2, 10)
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{index}', email=f'user{index}@example.com',
+                password='password')
+            for index in range(3)]
+        tags = [Tag.objects.create(name=f'тег {index}', slug=f'tag{index}')
+                for index in range(3)]
+        ingredients = [
+            Ingredient.objects.create(name=f'продукт {index}',
+                                      measurement_unit='г')
+            for index in range(5)]
+        for index in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.users[index % 3], name=f'рецепт {index}',
+                image='recipes/images/test.png', text='текст',
+                cooking_time=5)
+            recipe.tags.set(tags[:1 + index % 3])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=10)
+                for ingredient in ingredients[index % 2:])
+            if index % 2:
+                Favorite.objects.create(user=cls.users[0], recipe=recipe)
+            if index % 3:
+                ShoppingCart.objects.create(user=cls.users[0], recipe=recipe)
+
+    def count_queries(self, client, page_size):
+        clear_cache()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/recipes/', {'limit': page_size})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return len(queries)
+
+    def assertConstantQueries(self, client):
+        counts = [self.count_queries(client, page_size)
+                  for page_size in PAGE_SIZES]
+        self.assertEqual(counts[0], counts[-1],
+                         f'запросов при limit={PAGE_SIZES}: {counts}')
+
+    def test_anonymous(self):
+        self.assertConstantQueries(APIClient())
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        self.assertConstantQueries(client)
@@ -0,0 +1,115 @@
+import base64
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from api.benchmark import clear_cache
+from api.references import ingredient_cache, references_checked, tag_cache
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+
+def png_data_url():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class StaleReferencesTest(TestCase):
+    """Продукты и теги, удалённые в обход кэша процесса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        cls.tag = Tag.objects.create(name='тег', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'продукт {index}',
+                                      measurement_unit='г')
+            for index in range(2)]
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        clear_cache()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self):
+        return self.client.post('/api/recipes/', {
+            'name': 'рецепт', 'text': 'текст', 'cooking_time': 5,
+            'image': png_data_url(), 'tags': [self.tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 10}
+                            for ingredient in self.ingredients],
+        }, format='json')
+
+    def test_deleted_ingredient_is_validation_error(self):
+        ingredient_cache.all()
+        tag_cache.all()
+        # Удаление в другом процессе: кэш этого процесса о нём не знает.
+        Ingredient.objects.filter(pk=self.ingredients[1].pk).delete()
+        response = self.create_recipe()
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertEqual(self.create_recipe().status_code, 400)
+
+    def test_new_ingredient_is_loaded_once(self):
+        ingredient_cache.all()
+        ingredient = Ingredient.objects.create(name='новый продукт',
+                                               measurement_unit='шт')
+        missing_id = ingredient.id + 1
+        with self.assertNumQueries(1):
+            self.assertEqual(ingredient_cache.get(ingredient.id)['name'],
+                             'новый продукт')
+        with self.assertNumQueries(1):
+            self.assertIsNone(ingredient_cache.get(missing_id))
+        with self.assertNumQueries(0):
+            ingredient_cache.get(ingredient.id)
+            self.assertIsNone(ingredient_cache.get(missing_id))
+
+
+class ForeignKeyAtCommitTest(TransactionTestCase):
+    """Внешние ключи проверяются при фиксации транзакции."""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        self.recipe = Recipe.objects.create(
+            author=user, name='рецепт', image='',
+            text='текст', cooking_time=5)
+
+    def test_foreign_key_violation_is_validation_error(self):
+        @references_checked
+        @transaction.atomic
+        def save():
+            RecipeIngredient.objects.bulk_create([RecipeIngredient(
+                recipe=self.recipe, ingredient_id=10 ** 6, amount=1)])
+
+        with self.assertRaises(ValidationError):
+            save()
+        self.assertFalse(RecipeIngredient.objects.exists())
+
+    def test_other_integrity_errors_are_kept(self):
+        Tag.objects.create(name='тег', slug='tag')
+
+        @references_checked
+        @transaction.atomic
+        def save():
+            Tag.objects.create(name='другой тег', slug='tag')
+
+        with self.assertRaises(IntegrityError):
+            save()
@@ -0,0 +1,76 @@
+import os
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.renderers import (PDF_FONT_SIZE, PDF_TEXT_WIDTH,
+                           PDFShoppingListRenderer, load_pdf_font, wrap_line)
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart)
+
+User = get_user_model()
+
+has_font = skipUnless(os.path.exists(settings.SHOPPING_LIST_PDF_FONT),
+                      'нет шрифта SHOPPING_LIST_PDF_FONT')
+
+
+@has_font
+class PDFRendererTest(TestCase):
+
+    def test_font_is_subset(self):
+        pdf = b''.join(PDFShoppingListRenderer().render_lines(
+            ['Соль — 1 г']))
+        self.assertTrue(pdf.startswith(b'%PDF-'))
+        self.assertLess(len(pdf), 40 * 1024)
+
+    def test_other_characters_are_subset_per_document(self):
+        pdf = b''.join(PDFShoppingListRenderer().render_lines(
+            ['Соль → 1 г']))
+        self.assertLess(len(pdf), 20 * 1024)
+
+    def test_long_lines_are_wrapped(self):
+        font = load_pdf_font(settings.SHOPPING_LIST_PDF_FONT)
+        line = 'очень длинное название продукта ' * 10
+        parts = wrap_line(font, line)
+        self.assertGreater(len(parts), 1)
+        self.assertEqual(' '.join(parts), line)
+        for part in parts:
+            self.assertLessEqual(font.text_width(part, PDF_FONT_SIZE),
+                                 PDF_TEXT_WIDTH)
+        self.assertEqual(''.join(wrap_line(font, 'ж' * 500)), 'ж' * 500)
+
+
+class DownloadShoppingCartTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password')
+        recipe = Recipe.objects.create(
+            author=cls.user, name='рецепт', image='recipes/images/test.png',
+            text='текст', cooking_time=5)
+        RecipeIngredient.objects.create(
+            recipe=recipe, amount=10, ingredient=Ingredient.objects.create(
+                name='соль', measurement_unit='г'))
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, *args, **kwargs):
+        return self.client.get('/api/recipes/download_shopping_cart/',
+                               *args, **kwargs)
+
+    def test_unsupported_accept_falls_back_to_text(self):
+        response = self.download(HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+        self.assertIn('Соль', b''.join(response.streaming_content).decode())
+
+    def test_unknown_format_is_not_found(self):
+        self.assertEqual(self.download({'format': 'xml'}).status_code, 404)
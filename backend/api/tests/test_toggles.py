@@ -0,0 +1,124 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from recipes.counters import reconcile_counters
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart)
+
+User = get_user_model()
+
+THREADS = 8
+
+
+class ConcurrentTogglesTest(TransactionTestCase):
+    """Одновременные добавления и удаления меняют каждую связь один раз."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'user{index}', email=f'user{index}@example.com',
+                password='password')
+            for index in range(3)]
+        self.reader, self.author = self.users[0], self.users[1]
+        ingredients = [
+            Ingredient.objects.create(name=f'продукт {index}',
+                                      measurement_unit='г')
+            for index in range(4)]
+        self.recipes = []
+        for index in range(6):
+            recipe = Recipe.objects.create(
+                author=self.users[1 + index % 2], name=f'рецепт {index}',
+                image='', text='текст',
+                cooking_time=5)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=10 + index)
+                for ingredient in ingredients[index % 2:])
+            self.recipes.append(recipe)
+
+    def hammer(self, method, path, payloads=(None,) * THREADS):
+        """Отправляет запросы с payloads из отдельных потоков разом."""
+        barrier = threading.Barrier(len(payloads))
+
+        def send(data):
+            client = APIClient()
+            client.force_authenticate(self.reader)
+            barrier.wait()
+            try:
+                return getattr(client, method)(path, data, format='json')
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(len(payloads)) as pool:
+            return list(pool.map(send, payloads))
+
+    def assertConsistent(self):
+        self.assertEqual(
+            {counter: fixed for counter, fixed
+             in reconcile_counters().items() if fixed}, {})
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
+
+    def assertToggles(self, path, relations):
+        responses = self.hammer('post', path)
+        self.assertEqual(
+            sorted(response.status_code for response in responses),
+            [201] + [400] * (THREADS - 1))
+        self.assertEqual(relations.count(), 1)
+        self.assertConsistent()
+        responses = self.hammer('delete', path)
+        self.assertEqual(
+            sorted(response.status_code for response in responses),
+            [204] + [404] * (THREADS - 1))
+        self.assertFalse(relations.exists())
+        self.assertConsistent()
+
+    def test_favorite(self):
+        recipe = self.recipes[0]
+        self.assertToggles(
+            f'/api/recipes/{recipe.id}/favorite/',
+            Favorite.objects.filter(user=self.reader, recipe=recipe))
+
+    def test_shopping_cart(self):
+        recipe = self.recipes[0]
+        self.assertToggles(
+            f'/api/recipes/{recipe.id}/shopping_cart/',
+            ShoppingCart.objects.filter(user=self.reader, recipe=recipe))
+
+    def test_subscribe(self):
+        self.assertToggles(
+            f'/api/users/{self.author.id}/subscribe/',
+            Follow.objects.filter(user=self.reader, author=self.author))
+
+    def assertBulkToggles(self, path, ids):
+        # Наборы id пересекаются: каждый id есть в нескольких запросах.
+        batches = [ids[index % len(ids):] for index in range(THREADS)]
+        for method, changed in (('post', 'added'), ('delete', 'removed')):
+            responses = self.hammer(method, path,
+                                    [{'ids': batch} for batch in batches])
+            self.assertTrue(all(response.status_code == 200
+                                for response in responses))
+            changed_ids = sorted(
+                result['id'] for response in responses
+                for result in response.data['results']
+                if result['status'] == changed)
+            self.assertEqual(changed_ids, sorted(ids))
+            self.assertConsistent()
+
+    def test_bulk_favorite(self):
+        self.assertBulkToggles('/api/recipes/favorite/bulk/',
+                               [recipe.id for recipe in self.recipes])
+
+    def test_bulk_shopping_cart(self):
+        self.assertBulkToggles('/api/recipes/shopping_cart/bulk/',
+                               [recipe.id for recipe in self.recipes])
+
+    def test_bulk_subscribe(self):
+        self.assertBulkToggles('/api/users/subscribe/bulk/',
+                               [user.id for user in self.users[1:]])
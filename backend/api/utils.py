@@ -2,18 +2,14 @@ from datetime import datetime
 
 
 def render_shopping_list(ingredients, recipes):
-
-    return '\n'.join([
-        f"Список покупок составлен: {datetime.now().strftime('%d-%m-%Y')}",
-        "Список продуктов:"
-    ] + [
-        f'{index}.'
-        f' {ingredient["ingredient__name"].capitalize()}'
-        f'— {ingredient["total_amount"]}'
-        f' {ingredient["ingredient__measurement_unit"]}'
-        for index, ingredient in enumerate(ingredients, 1)
-    ] + [
-        'Рецепты, для которых составлен список покупок:'
-    ] + [
-        f'{index}. {recipe.name}' for index, recipe in enumerate(recipes, 1)
-    ])
+    """Построчно отдаёт текст списка покупок, не собирая его в памяти."""
+    yield f"Список покупок составлен: {datetime.now().strftime('%d-%m-%Y')}"
+    yield 'Список продуктов:'
+    for index, ingredient in enumerate(ingredients, 1):
+        yield (f'{index}.'
+               f' {ingredient["ingredient__name"].capitalize()}'
+               f'— {ingredient["total_amount"]}'
+               f' {ingredient["ingredient__measurement_unit"]}')
+    yield 'Рецепты, для которых составлен список покупок:'
+    for index, recipe in enumerate(recipes, 1):
+        yield f'{index}. {recipe}'
@@ -1,52 +1,72 @@
+from itertools import chain
+
 from api.filters import RecipeFilter
-from api.paginations import FoodgramPageNumberPagination
-from api.permissions import IsAuthorOrReadOnlyPermission
+from api.paginations import (FoodgramLimitOffsetPagination,
+                             FoodgramPageNumberPagination)
+from api.permissions import IsAuthorOrReadOnlyPermission, IsInternalOrAdmin
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import F, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import permissions, status, viewsets
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
-
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag, Follow)
+from rest_framework.views import APIView
+
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes import bulk, relations
+from recipes.feed import fan_out, get_page as get_feed_page
+from .autocomplete import ingredient_index
+from .cache import CachedResponseMixin, get_stats
+from .conditional import ConditionalGetMixin, conditional
 from .filters import IngredientFilter
+from .metrics import registry
+from .references import references_checked
+from .renderers import (CSVShoppingListRenderer, FallbackContentNegotiation,
+                        PDFShoppingListRenderer, TextShoppingListRenderer)
 from .serializers import (IngredientSerializer, RecipeCreateUpdateSerializer,
                           RecipeSerializer, TagSerializer, UserSerializer,
-                          FollowSerializer, AvatarSerializer)
-from .utils import render_shopping_list
+                          FollowSerializer, AvatarSerializer,
+                          BulkIdsSerializer)
 
 User = get_user_model()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+def bulk_response(results):
+    """Ответ массового действия: статус для каждого id."""
+    return Response({'results': [
+        {'id': pk, 'status': result} for pk, result in results.items()]})
+
+
+class RecipeViewSet(ConditionalGetMixin, CachedResponseMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
     pagination_class = FoodgramPageNumberPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    cache_group = 'recipes'
+    etag_groups = ('recipes',)
 
     def get_queryset(self):
         """
-        Переопределяем get_queryset, чтобы корректно фильтровать рецепты
-        по корзине покупок пользователя.
+        Собираем queryset с подгруженными автором, тегами и продуктами и
+        аннотациями избранного/корзины, чтобы сериализатор не ходил в базу
+        за каждым рецептом.
         """
         queryset = super().get_queryset()
-        user = self.request.user
-
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart')
-        if is_in_shopping_cart == '1' and user.is_authenticated:
-            queryset = queryset.filter(shoppingcarts__user=user)
-
-        return queryset
+        if self.action in ('list', 'retrieve', 'trending', 'feed'):
+            return queryset.with_related(self.request.user)
+        return queryset.with_user_flags(self.request.user)
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
@@ -54,28 +74,46 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return RecipeSerializer
 
+    @references_checked
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        fan_out(recipe)
+
+    @references_checked
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
 
     @staticmethod
     def update_user_recipe_status(request, model, recipe, user,
                                   success_add_message, success_remove_message):
 
         if request.method == 'POST':
-            _, created = model.objects.get_or_create(recipe=recipe,
-                                                     user=user)
-            if not created:
+            if not relations.add_recipe(model, user, recipe):
                 raise ValidationError(
                     {'status': f'рецепт уже {success_add_message}'})
             return Response(
                 {'status': f'рецепт добавлен {success_add_message}'},
                 status=status.HTTP_201_CREATED)
 
-        if request.method == 'DELETE':
-            get_object_or_404(model, user=user.id, recipe=recipe.id).delete()
-            return Response(
-                {'status': f'рецепт удален {success_remove_message}'},
-                status=status.HTTP_204_NO_CONTENT)
+        if not relations.remove_recipe(model, user, recipe):
+            raise NotFound(f'рецепта нет {success_remove_message}')
+        return Response(
+            {'status': f'рецепт удален {success_remove_message}'},
+            status=status.HTTP_204_NO_CONTENT)
+
+    def update_user_recipes_bulk(self, request, model):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        change = (bulk.add_recipes if request.method == 'POST'
+                  else bulk.remove_recipes)
+        return bulk_response(change(
+            model, request.user, serializer.validated_data['ids']))
 
     @action(detail=True, methods=['post', 'delete'])
     def favorite(self, request, pk=None):
@@ -103,24 +141,87 @@ class RecipeViewSet(viewsets.ModelViewSet):
             success_remove_message='из списка покупок'
         )
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=(IsAuthenticated,), url_path='favorite/bulk')
+    def favorite_bulk(self, request):
+        return self.update_user_recipes_bulk(request, Favorite)
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=(IsAuthenticated,),
+            url_path='shopping_cart/bulk')
+    def shopping_cart_bulk(self, request):
+        return self.update_user_recipes_bulk(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(TextShoppingListRenderer,
+                          CSVShoppingListRenderer,
+                          PDFShoppingListRenderer),
+        content_negotiation_class=FallbackContentNegotiation,
+    )
     def download_shopping_cart(self, request):
         user = request.user
-        shopping_cart = ShoppingCart.objects.filter(user=user)
-        if not shopping_cart.exists():
-            raise ValidationError({'status': 'Ваш список покупок пуст'})
-
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in=shopping_cart.values_list('recipe', flat=True)).values(
+        ingredients = ShoppingListItem.objects.filter(user=user).values(
             'ingredient__name',
-            'ingredient__measurement_unit').annotate(total_amount=Sum('amount')
-                                                     )
+            'ingredient__measurement_unit',
+            'total_amount').order_by('ingredient__name').iterator()
+        first_ingredient = next(ingredients, None)
+        if first_ingredient is None:
+            raise ValidationError({'status': 'Ваш список покупок пуст'})
 
         recipes = Recipe.objects.filter(
-            id__in=shopping_cart.values_list('recipe', flat=True))
-        return FileResponse(render_shopping_list(ingredients, recipes),
-                            content_type='text/plain',
-                            filename='shopping_list.txt')
+            shoppingcarts__user=user).values_list('name', flat=True)
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(chain((first_ingredient,), ingredients), recipes),
+            content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"')
+        return response
+
+    @action(detail=False, methods=['get'])
+    @conditional
+    def trending(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            ranking__isnull=False).order_by('-ranking__score', '-pub_date')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """
+        Рецепты авторов из подписок, от новых к старым.
+
+        Страницы переключаются только вперёд по ссылке next (курсор), count
+        не считается.
+        """
+        paginator = self.paginator
+        paginator.request = request
+        reverse, position = paginator.decode_cursor(
+            request.query_params.get(paginator.cursor_query_param, ''),
+            Recipe)
+        if reverse:
+            raise NotFound(paginator.invalid_cursor_message)
+        page, next_position = get_feed_page(
+            request.user, paginator.get_page_size(request), position)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in page])
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for _, recipe_id in page
+             if recipe_id in recipes], many=True)
+        return Response({
+            'count': None,
+            'next': paginator.encode_cursor(False, next_position),
+            'previous': None,
+            'results': serializer.data,
+        })
 
     @action(
         detail=True,
@@ -137,27 +238,57 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return JsonResponse({'short-link': short_link})
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, CachedResponseMixin,
+                        viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,
                           IsAuthorOrReadOnlyPermission,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    cache_group = 'ingredients'
+    etag_groups = ('ingredients',)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and settings.INGREDIENT_SEARCH == 'memory':
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
-class TagViewSet(viewsets.ModelViewSet):
+
+class TagViewSet(ConditionalGetMixin, CachedResponseMixin,
+                 viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,
                           IsAuthorOrReadOnlyPermission,)
+    cache_group = 'tags'
+    etag_groups = ('tags',)
+
+
+class CacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
 
+    def get(self, request):
+        return Response(get_stats())
 
-class UserViewSet(DjoserUserViewSet):
+
+class MetricsView(APIView):
+    """Агрегаты метрик запросов в формате Prometheus."""
+
+    permission_classes = (IsInternalOrAdmin,)
+
+    def get(self, request):
+        return HttpResponse(registry.render(),
+                            content_type='text/plain; version=0.0.4')
+
+
+class UserViewSet(ConditionalGetMixin, DjoserUserViewSet):
     serializer_class = UserSerializer
     queryset = User.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    pagination_class = LimitOffsetPagination
+    pagination_class = FoodgramLimitOffsetPagination
+    etag_groups = ('users', 'recipes')
 
     def get_permissions(self):
 
@@ -165,6 +296,11 @@ class UserViewSet(DjoserUserViewSet):
             return [IsAuthenticated()]
         return super().get_permissions()
 
+    @action(('get', 'put', 'patch', 'delete'), detail=False)
+    @conditional
+    def me(self, request, *args, **kwargs):
+        return super().me(request, *args, **kwargs)
+
     @action(
         detail=True,
         methods=('post', 'delete'),
@@ -178,38 +314,80 @@ class UserViewSet(DjoserUserViewSet):
         author = get_object_or_404(User, id=id)
 
         if request.method == 'POST':
-            _, created = Follow.objects.get_or_create(author=author,
-                                                      user=user)
             if user == author:
                 raise ValidationError(
                     {'status': 'нельзя подписаться на самого себя'})
-            if created:
+            if not relations.follow(user, author):
                 raise ValidationError(
                     {'status': f'вы уже подписаны на {author.username}'})
             return Response(
                 {'message': f'вы подписались на {author.username}'},
                 status=status.HTTP_201_CREATED)
 
-        get_object_or_404(Follow, user=user.id, author=author.id).delete()
+        if not relations.unfollow(user, author):
+            raise NotFound(f'вы не подписаны на {author.username}')
         return Response({'message': f'вы отписались от {author.username}'},
                         status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe/bulk',
+        url_name='subscribe-bulk',
+    )
+    def subscribe_bulk(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        change = bulk.follow if request.method == 'POST' else bulk.unfollow
+        results = change(request.user, serializer.validated_data['ids'])
+        return bulk_response(results)
+
     @action(
         detail=False,
         methods=('get',),
         permission_classes=(IsAuthenticated, ),
     )
+    @conditional
     def subscriptions(self, request):
 
+        limit = self.get_recipes_limit(request)
         queryset = User.objects.filter(authors__user=self.request.user)
-        if not queryset:
+        if not queryset.exists():
             raise ValidationError({'status': 'у вас нет подписок'})
 
+        recipes = Recipe.objects.annotate(row_number=Window(
+            RowNumber(), partition_by=F('author'),
+            order_by=F('pub_date').desc()))
+        if limit:
+            recipes = recipes.filter(row_number__lte=limit)
+        queryset = queryset.annotate(
+            is_subscribed=Value(True),
+        ).prefetch_related(Prefetch('recipes', queryset=recipes,
+                                    to_attr='recipes_preview'))
+
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(pages, many=True,
-                                      context={'request': request})
+                                      context={'request': request,
+                                               'recipes_limit': limit})
         return self.get_paginated_response(serializer.data)
 
+    @staticmethod
+    def get_recipes_limit(request):
+        limit = request.query_params.get('recipes_limit')
+        if limit is None:
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError(
+                'Параметр "recipes_limit" должен быть целым числом.')
+        if limit < 0:
+            raise ValidationError(
+                'Параметр "recipes_limit" должен быть положительным'
+                'числом.')
+        return limit or None
+
     @action(detail=False, methods=['put', 'delete'], url_path='me/avatar')
     def update_avatar(self, request):
         user = request.user
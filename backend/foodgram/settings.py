@@ -24,7 +24,7 @@ USE_SQLITE = os.getenv('USE_SQLITE', 'False') == 'True'
 SECRET_KEY = os.getenv('SECRET_KEY', 'SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '127.0.0.1,localhost').split(',')
 
@@ -43,11 +43,11 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'djoser',
     'django_filters',
-    'debug_toolbar',
     'django_extensions',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,10 +55,14 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
-
 ]
 
+# debug_toolbar собирает SQL каждого запроса и годится только для отладки,
+# в рабочем окружении его заменяют метрики api.metrics.
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -88,6 +92,9 @@ if USE_SQLITE:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Тестовая база в файле: тесты с потоками открывают к ней
+            # отдельные соединения.
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 else:
@@ -102,6 +109,36 @@ else:
         }
     }
 
+# Кэш ответов API для анонимных пользователей. По умолчанию — память
+# процесса, при заданном REDIS_URL — общий Redis (нужен пакет redis).
+# Версии данных (для ключей кэша и ETag) в памяти процесса не видят
+# изменений из других воркеров, поэтому живут не дольше TTL ответа.
+REDIS_URL = os.getenv('REDIS_URL')
+
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 60))
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+    CACHE_VERSION_TIMEOUT = None
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    CACHE_VERSION_TIMEOUT = RESPONSE_CACHE_TTL
+
+# Количество объектов в пагинации: точное значение кэшируется на TTL секунд,
+# на PostgreSQL выборки больше порога считаются по оценке планировщика.
+PAGINATION_COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_CACHE_TTL', 30))
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_COUNT_ESTIMATE_THRESHOLD', 10000))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -147,6 +184,21 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Уменьшенные копии загружаемых картинок (см. recipes.images). Копии
+# готовятся в пуле из IMAGE_VARIANT_WORKERS потоков; при
+# IMAGE_VARIANTS_ASYNC=False — сразу после фиксации транзакции.
+IMAGE_VARIANT_WIDTHS = tuple(
+    int(width) for width in
+    os.getenv('IMAGE_VARIANT_WIDTHS', '200,400,800').split(','))
+IMAGE_VARIANT_FORMATS = tuple(
+    os.getenv('IMAGE_VARIANT_FORMATS', 'webp,avif').split(','))
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+IMAGE_VARIANTS_ASYNC = os.getenv('IMAGE_VARIANTS_ASYNC', 'True') == 'True'
+# Ограничения загружаемой картинки: размер файла в байтах (как
+# client_max_body_size в nginx) и стороны по заголовку файла.
+IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('IMAGE_MAX_UPLOAD_SIZE', 10 * 2 ** 20))
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', 4096))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -182,4 +234,35 @@ INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# Метрики запросов (см. api.metrics): заголовок Server-Timing (при DEBUG,
+# для METRICS_ALLOWED_NETWORKS и администраторов), журнал
+# запросов дольше METRICS_SLOW_REQUEST_MS мс (доля METRICS_SLOW_SAMPLE_RATE,
+# не больше METRICS_SLOW_SQL_LIMIT SQL-запросов в записи) и агрегаты для
+# Prometheus на /api/metrics/, доступные из METRICS_ALLOWED_NETWORKS.
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', 500))
+METRICS_SLOW_SAMPLE_RATE = float(os.getenv('METRICS_SLOW_SAMPLE_RATE', 1))
+METRICS_SLOW_SQL_LIMIT = int(os.getenv('METRICS_SLOW_SQL_LIMIT', 20))
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    'METRICS_ALLOWED_NETWORKS',
+    '127.0.0.0/8,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16').split(',')
+
+# Лента подписок (см. recipes.feed): рецепты авторов, у которых не больше
+# FEED_FANOUT_LIMIT подписчиков, раскладываются по лентам при публикации,
+# рецепты остальных подмешиваются при чтении. При подписке в ленту
+# добавляются последние FEED_BACKFILL рецептов автора.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 5000))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 20))
+
+# TrueType-шрифт с кириллицей для PDF списка покупок (подмножество его
+# глифов встраивается в документ), в образе ставится пакетом
+# fonts-dejavu-core.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+# Поиск продуктов для автодополнения: 'memory' — индекс в памяти процесса,
+# 'database' — запрос к базе (на PostgreSQL с триграммным индексом).
+INGREDIENT_SEARCH = os.getenv('INGREDIENT_SEARCH', 'memory')
+
 CSRF_TRUSTED_ORIGINS = ['https://foodgramsub.crabdance.com']
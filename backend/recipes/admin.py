@@ -5,8 +5,9 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.safestring import mark_safe
 
-from .models import (Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Favorite, Follow, Tag)
+from .models import (ImportCheckpoint, Ingredient, Recipe, RecipeIngredient,
+                     RecipeRanking, ShoppingCart, ShoppingListItem, Favorite,
+                     Follow, Tag)
 
 
 User = get_user_model()
@@ -43,9 +44,9 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('tags', 'author')
     inlines = [RecipeIngredientInline]
 
-    @admin.display(description='в избранном')
+    @admin.display(description='в избранном', ordering='favorites_count')
     def favorite_count(self, recipe):
-        return recipe.favorites.count()
+        return recipe.favorites_count
 
     @admin.display(description='Дата публикации')
     def formatted_pub_date(self, recipe):
@@ -95,6 +96,23 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     search_fields = ('recipe__name', 'user')
 
 
+@admin.register(RecipeRanking)
+class RecipeRankingAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'score', 'updated_at')
+    search_fields = ('recipe__name',)
+
+
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'next_line', 'updated_at')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total_amount')
+    search_fields = ('user__username', 'ingredient__name')
+
+
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'user')
@@ -108,17 +126,17 @@ class UserAdmin(BaseUserAdmin):
                     'recipes_count', 'avatar_display')
     search_fields = ('email', 'username')
 
-    @admin.display(description='подписок')
+    @admin.display(description='подписок', ordering='follows_count')
     def follows_count(self, user):
-        return user.authors.count()
+        return user.follows_count
 
-    @admin.display(description='подписчиков')
+    @admin.display(description='подписчиков', ordering='followers_count')
     def followers_count(self, user):
-        return user.followers.count()
+        return user.followers_count
 
-    @admin.display(description='рецептов')
+    @admin.display(description='рецептов', ordering='recipes_count')
     def recipes_count(self, user):
-        return user.recipes.count()
+        return user.recipes_count
 
     @admin.display(description='Аватар')
     @mark_safe
@@ -0,0 +1,88 @@
+"""
+Избранное, корзина и подписки для списка рецептов или авторов за раз.
+
+Связи вставляются одним INSERT ... SELECT ... ON CONFLICT DO NOTHING
+RETURNING и удаляются одним DELETE ... RETURNING (см. recipes.relations),
+статусы остальных id выясняются уже после изменения. Счётчики, списки покупок и
+ленты подписок сдвигаются только на строки, которые вернул запрос,
+поэтому пересекающиеся запросы не учитывают одну связь дважды.
+
+Функции возвращают статус для каждого id: ADDED, EXISTS, REMOVED,
+MISSING (связи не было), NOT_FOUND (объекта нет) или SELF (подписка на
+себя).
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .models import Follow, Recipe
+from .relations import (authors_followed, authors_unfollowed,
+                        delete_returning, insert_ignore, recipes_added,
+                        recipes_removed)
+
+User = get_user_model()
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+
+@transaction.atomic
+def add_recipes(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину (model) пользователя."""
+    added = set(insert_ignore(model, 'recipe_id', recipe_ids,
+                              user_id=user.id))
+    if added:
+        recipes_added(model, user, list(added))
+    found = added | set(Recipe.objects.filter(
+        id__in=set(recipe_ids) - added).values_list('id', flat=True))
+    return {pk: (NOT_FOUND if pk not in found
+                 else ADDED if pk in added else EXISTS)
+            for pk in recipe_ids}
+
+
+@transaction.atomic
+def remove_recipes(model, user, recipe_ids):
+    """Убирает рецепты из избранного или корзины (model) пользователя."""
+    removed = set(delete_returning(model, 'recipe_id', user_id=user.id,
+                                   recipe_id=recipe_ids))
+    if removed:
+        recipes_removed(model, user, list(removed))
+    found = removed | set(Recipe.objects.filter(
+        id__in=set(recipe_ids) - removed).values_list('id', flat=True))
+    return {pk: (NOT_FOUND if pk not in found
+                 else REMOVED if pk in removed else MISSING)
+            for pk in recipe_ids}
+
+
+@transaction.atomic
+def follow(user, author_ids):
+    """Подписывает пользователя на авторов."""
+    added = set(insert_ignore(
+        Follow, 'author_id', [pk for pk in author_ids if pk != user.id],
+        user_id=user.id))
+    authors = User.objects.filter(id__in=author_ids).exclude(
+        id=user.id).in_bulk()
+    if added:
+        authors_followed(user, [authors[pk] for pk in added])
+    return {pk: (SELF if pk == user.id
+                 else NOT_FOUND if pk not in authors
+                 else ADDED if pk in added else EXISTS)
+            for pk in author_ids}
+
+
+@transaction.atomic
+def unfollow(user, author_ids):
+    """Отписывает пользователя от авторов."""
+    removed = set(delete_returning(Follow, 'author_id', user_id=user.id,
+                                   author_id=author_ids))
+    if removed:
+        authors_unfollowed(user, list(removed))
+    found = removed | set(User.objects.filter(
+        id__in=set(author_ids) - removed).values_list('id', flat=True))
+    return {pk: (SELF if pk == user.id
+                 else NOT_FOUND if pk not in found
+                 else REMOVED if pk in removed else MISSING)
+            for pk in author_ids}
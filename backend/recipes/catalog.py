@@ -0,0 +1,138 @@
+"""
+Загрузка справочника продуктов из CSV или JSON.
+
+Файл читается потоково и пишется пачками: для каждой пачки одним запросом
+выясняется, какие продукты уже есть, а новые вставляются через
+bulk_create(ignore_conflicts=True). Поэтому загрузку можно безопасно
+повторять, в том числе параллельно. Ключ продукта — пара (название,
+единица измерения), других полей у него нет, так что существующую запись
+менять нечего: она считается неизменной.
+"""
+import csv
+import json
+from dataclasses import dataclass
+from itertools import islice
+
+from django.dispatch import Signal
+
+from .models import Ingredient
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Отправляется после вставки новых продуктов.
+ingredients_imported = Signal()
+
+
+class CatalogError(ValueError):
+    """Некорректная запись справочника."""
+
+
+@dataclass
+class ImportStats:
+    inserted: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+
+
+def read_csv(file):
+    """Записи (название, единица) из CSV без заголовка."""
+    for row in csv.reader(file):
+        if row:
+            yield row
+
+
+def read_json(file):
+    """
+    Записи из JSON-массива объектов, без загрузки всего файла в память.
+
+    Массив разбирается по одному элементу с помощью raw_decode по мере
+    чтения файла кусками.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started and buffer:
+            if buffer[0] != '[':
+                raise CatalogError('ожидается JSON-массив')
+            buffer = buffer[1:].lstrip()
+            started = True
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if started and buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    raise CatalogError('некорректный JSON')
+            else:
+                buffer = buffer[end:]
+                yield item
+                continue
+        if eof:
+            raise CatalogError('неожиданный конец JSON')
+        chunk = file.read(JSON_CHUNK_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def parse_item(item):
+    """Ключ (название, единица) из записи CSV или JSON."""
+    try:
+        if isinstance(item, dict):
+            name, unit = item['name'], item['measurement_unit']
+        else:
+            name, unit = item
+        name, unit = name.strip(), unit.strip()
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise CatalogError(f'некорректная запись: {item!r}')
+    max_name = Ingredient._meta.get_field('name').max_length
+    max_unit = Ingredient._meta.get_field('measurement_unit').max_length
+    if not name or not unit or len(name) > max_name or len(unit) > max_unit:
+        raise CatalogError(f'некорректная запись: {item!r}')
+    return name, unit
+
+
+def import_ingredients(items, batch_size=5000, on_error=None):
+    """Добавляет отсутствующие продукты и возвращает ImportStats."""
+    stats = ImportStats()
+    seen = set()
+    items = iter(items)
+    while batch := list(islice(items, batch_size)):
+        keys = []
+        for item in batch:
+            try:
+                key = parse_item(item)
+            except CatalogError as error:
+                stats.invalid += 1
+                if on_error:
+                    on_error(error)
+                continue
+            if key in seen:
+                stats.duplicates += 1
+                continue
+            seen.add(key)
+            keys.append(key)
+        if not keys:
+            continue
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('name', 'measurement_unit')).intersection(keys)
+        new = [key for key in keys if key not in existing]
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in new),
+            batch_size=batch_size, ignore_conflicts=True)
+        stats.inserted += len(new)
+        stats.unchanged += len(existing)
+    if stats.inserted:
+        ingredients_imported.send(sender=Ingredient)
+    return stats
@@ -0,0 +1,65 @@
+"""
+Денормализованные счётчики избранного, корзин, рецептов и подписок.
+
+Счётчики хранятся в колонках Recipe и User и меняются атомарным
+UPDATE ... SET field = field ± n при создании и удалении связанных строк
+(см. recipes.signals). Команда reconcile_counters пересчитывает их по
+исходным таблицам.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Follow, Recipe, ShoppingCart, User
+
+# Модель-источник: [(поле внешнего ключа, модель со счётчиком, счётчик)].
+COUNTERS = {
+    Favorite: [('recipe', Recipe, 'favorites_count')],
+    ShoppingCart: [('recipe', Recipe, 'shopping_cart_count')],
+    Recipe: [('author', User, 'recipes_count')],
+    Follow: [('author', User, 'followers_count'),
+             ('user', User, 'follows_count')],
+}
+
+
+def change_counters(model, target_ids, delta):
+    """
+    Сдвигает счётчики на delta для строк model, ссылающихся на target_ids.
+
+    target_ids — словарь {поле внешнего ключа: {id: количество строк}}.
+    Строки с одинаковым количеством обновляются одним запросом.
+    """
+    for field, target, counter in COUNTERS[model]:
+        by_count = defaultdict(list)
+        for target_id, count in target_ids.get(field, {}).items():
+            by_count[count].append(target_id)
+        for count, ids in by_count.items():
+            queryset = target.objects.filter(pk__in=ids)
+            if delta < 0:
+                queryset = queryset.filter(**{f'{counter}__gte': count})
+            queryset.update(**{counter: F(counter) + delta * count})
+
+
+def change_instance_counters(instance, delta):
+    change_counters(type(instance), {
+        field: {getattr(instance, f'{field}_id'): 1}
+        for field, _, _ in COUNTERS[type(instance)]
+    }, delta)
+
+
+def actual_count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')), 0)
+
+
+def reconcile_counters():
+    """Исправляет расхождения счётчиков, возвращает {счётчик: строк}."""
+    fixed = {}
+    for model, counters in COUNTERS.items():
+        for field, target, counter in counters:
+            actual = actual_count(model, field)
+            fixed[f'{target.__name__}.{counter}'] = target.objects.exclude(
+                **{counter: actual}).update(**{counter: actual})
+    return fixed
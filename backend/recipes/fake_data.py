@@ -0,0 +1,313 @@
+"""
+Синтетические данные для замеров производительности и нагрузки.
+
+Популярность распределена по закону Ципфа: немногие авторы пишут
+большую часть рецептов и собирают большую часть подписчиков, немногие
+рецепты попадают в большинство избранного и корзин, а часть продуктов
+(соль, сахар) встречается почти в каждом рецепте. Генератор случайных
+чисел детерминирован, так что при одинаковых параметрах и seed
+получается одинаковый набор данных.
+
+Строки создаются потоково с явными id и пишутся пачками: на PostgreSQL
+через COPY, на остальных базах — bulk_create. После вставки
+пересчитываются последовательности id, счётчики, списки покупок,
+поисковый индекс, рейтинг и ленты подписок.
+"""
+import csv
+import json
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import StringIO
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import feed
+from .counters import reconcile_counters
+from .models import (Favorite, Follow, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, Tag)
+from .ranking import WINDOW_DAYS, update_ranking
+from .search import update_search_index
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+PASSWORD = 'password'
+TAGS = (('Завтрак', 'breakfast'), ('Обед', 'lunch'), ('Ужин', 'dinner'))
+WORDS = ('суп', 'салат', 'пирог', 'каша', 'рагу', 'омлет', 'паста', 'плов',
+         'запеканка', 'котлеты', 'блины', 'соус', 'десерт', 'суфле')
+UNITS = ('г', 'мл', 'шт.', 'ст. л.', 'ч. л.')
+INGREDIENTS_PER_RECIPE = (3, 10)
+# Рецепты публикуются равномерно за этот период до текущего момента.
+HISTORY_DAYS = 365
+
+
+@dataclass
+class FakeDataConfig:
+    users: int = 100
+    recipes: int = 1000
+    ingredients: int = 500
+    follows: int = 500
+    favorites: int = 3000
+    carts: int = 500
+    zipf: float = 1.1
+    seed: int = 0
+
+
+class ZipfSampler:
+    """Выбор элементов population с вероятностью 1 / ранг ** exponent."""
+
+    def __init__(self, rng, population, exponent):
+        self.rng = rng
+        self.population = list(population)
+        # Ранги раздаются в случайном порядке, иначе популярными были бы
+        # всегда самые старые id.
+        rng.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.population) + 1)))
+
+    def __len__(self):
+        return len(self.population)
+
+    def choices(self, k):
+        return self.rng.choices(self.population, cum_weights=self.cum_weights,
+                                k=k)
+
+    def distinct(self, k, exclude=None):
+        """k разных элементов (не больше половины population)."""
+        k = min(k, len(self.population) // 2)
+        chosen = set()
+        while len(chosen) < k:
+            chosen.update(self.choices(k - len(chosen)))
+            chosen.discard(exclude)
+        return chosen
+
+    def split(self, total):
+        """Делит total между элементами: {элемент: доля по Ципфу}."""
+        scale = total / self.cum_weights[-1]
+        previous = 0
+        shares = {}
+        for item, cumulative in zip(self.population, self.cum_weights):
+            shares[item] = round(cumulative * scale) - round(previous * scale)
+            previous = cumulative
+        return shares
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Отключает auto_now_add, чтобы сохранить заданные даты."""
+    fields = [field for model in models for field in model._meta.fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def copy_rows(model, objects):
+    """Пишет пачку объектов в таблицу модели через COPY FROM STDIN."""
+    fields = [field for field in model._meta.concrete_fields
+              if not (field.primary_key and objects[0].pk is None)]
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for obj in objects:
+        row = []
+        for field in fields:
+            value = field.get_prep_value(field.pre_save(obj, True))
+            if value is None:
+                value = r'\N'
+            elif isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            row.append(value)
+        writer.writerow(row)
+    buffer.seek(0)
+    columns = ', '.join(connection.ops.quote_name(field.column)
+                        for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+            f"({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer)
+
+
+def write(model, objects, batch_size=BATCH_SIZE):
+    """Пишет объекты пачками, возвращает их количество."""
+    objects = iter(objects)
+    written = 0
+    while batch := list(islice(objects, batch_size)):
+        if connection.vendor == 'postgresql':
+            copy_rows(model, batch)
+        else:
+            model.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def next_id(model):
+    return (model.objects.aggregate(max_id=Max('pk'))['max_id'] or 0) + 1
+
+
+class FakeDataGenerator:
+    """Генерация набора данных по FakeDataConfig."""
+
+    def __init__(self, config, prefix='fake', batch_size=BATCH_SIZE,
+                 log=None):
+        self.config = config
+        self.prefix = f'{prefix}{config.seed}_'
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.rng = random.Random(config.seed)
+        self.now = timezone.now()
+
+    def step(self, title, function, *args):
+        started = time.monotonic()
+        result = function(*args)
+        elapsed = time.monotonic() - started
+        rows = result if isinstance(result, int) else None
+        if isinstance(result, (list, range)):
+            rows = len(result)
+        if rows is None:
+            self.log(f'{title}: {elapsed:.1f} с')
+        else:
+            self.log(f'{title}: {rows} строк за {elapsed:.1f} с '
+                     f'({rows / max(elapsed, 1e-9):.0f} строк/с)')
+        return result
+
+    def write(self, model, objects):
+        return write(model, objects, self.batch_size)
+
+    def exists(self):
+        return User.objects.filter(username__startswith=self.prefix).exists()
+
+    @transaction.atomic
+    def generate(self):
+        """Создаёт данные и возвращает id созданных пользователей."""
+        with explicit_timestamps(Recipe, Favorite, ShoppingCart):
+            tag_ids = self.step('Теги', self.create_tags)
+            ingredients = self.step('Продукты', self.create_ingredients)
+            user_ids = self.step('Пользователи', self.create_users)
+            authors = ZipfSampler(self.rng, user_ids, self.config.zipf)
+            recipe_ids = self.step('Рецепты', self.create_recipes, authors)
+            self.step('Продукты рецептов', self.create_recipe_ingredients,
+                      recipe_ids, ZipfSampler(self.rng, ingredients,
+                                              self.config.zipf))
+            self.step('Теги рецептов', self.create_recipe_tags, recipe_ids,
+                      tag_ids)
+            self.step('Подписки', self.create_follows, user_ids, authors)
+            popular = ZipfSampler(self.rng, recipe_ids, self.config.zipf)
+            active = ZipfSampler(self.rng, user_ids, self.config.zipf)
+            for title, model, total in (
+                    ('Избранное', Favorite, self.config.favorites),
+                    ('Корзины', ShoppingCart, self.config.carts)):
+                self.step(title, self.create_user_recipes, model, total,
+                          active, popular)
+        self.step('Последовательности id', self.reset_sequences)
+        self.step('Счётчики', reconcile_counters)
+        self.step('Списки покупок', ShoppingListItem.objects.rebuild)
+        self.step('Поисковый индекс', update_search_index)
+        self.step('Рейтинг', update_ranking)
+        self.step('Ленты подписок', feed.rebuild)
+        return user_ids
+
+    def create_tags(self):
+        for name, slug in TAGS:
+            Tag.objects.get_or_create(slug=slug, defaults={'name': name})
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_ingredients(self):
+        missing = self.config.ingredients - Ingredient.objects.count()
+        self.write(Ingredient, (
+            Ingredient(name=f'{self.prefix}продукт {number}',
+                       measurement_unit=self.rng.choice(UNITS))
+            for number in range(max(missing, 0))))
+        return list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True)[:self.config.ingredients])
+
+    def create_users(self):
+        start = next_id(User)
+        password = make_password(PASSWORD)
+        self.write(User, (
+            User(id=start + number, username=f'{self.prefix}{number}',
+                 email=f'{self.prefix}{number}@example.com',
+                 password=password, first_name=f'Имя{number}',
+                 last_name=f'Фамилия{number}', date_joined=self.now)
+            for number in range(self.config.users)))
+        return range(start, start + self.config.users)
+
+    def create_recipes(self, authors):
+        start = next_id(Recipe)
+        total = self.config.recipes
+        step = timezone.timedelta(days=HISTORY_DAYS) / max(total, 1)
+        rng = self.rng
+
+        def recipes():
+            for offset in range(0, total, self.batch_size):
+                count = min(self.batch_size, total - offset)
+                for number, author_id in enumerate(authors.choices(count),
+                                                   offset):
+                    yield Recipe(
+                        id=start + number, author_id=author_id,
+                        name=(f'{rng.choice(WORDS)} {rng.choice(WORDS)} '
+                              f'{number}'),
+                        text=' '.join(rng.choices(WORDS, k=30)),
+                        cooking_time=rng.randint(5, 180),
+                        image='recipes/images/fake.png',
+                        pub_date=self.now - step * (total - number))
+
+        self.write(Recipe, recipes())
+        return range(start, start + total)
+
+    def create_recipe_ingredients(self, recipe_ids, ingredients):
+        low, high = INGREDIENTS_PER_RECIPE
+        return self.write(RecipeIngredient, (
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=self.rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in ingredients.distinct(
+                self.rng.randint(low, high))))
+
+    def create_recipe_tags(self, recipe_ids, tag_ids):
+        return self.write(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(
+                tag_ids, self.rng.randint(1, len(tag_ids)))))
+
+    def create_follows(self, user_ids, authors):
+        followers = ZipfSampler(self.rng, user_ids, self.config.zipf)
+        return self.write(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, count in followers.split(
+                self.config.follows).items()
+            for author_id in authors.distinct(count, exclude=user_id)))
+
+    def create_user_recipes(self, model, total, users, recipes):
+        window = timezone.timedelta(days=WINDOW_DAYS)
+        return self.write(model, (
+            model(user_id=user_id, recipe_id=recipe_id,
+                  created=self.now - window * self.rng.random())
+            for user_id, count in users.split(total).items()
+            for recipe_id in recipes.distinct(count)))
+
+    def reset_sequences(self):
+        models = [User, Ingredient, Recipe, RecipeIngredient, Favorite,
+                  ShoppingCart, Follow, Recipe.tags.through]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+
+def generate(config, prefix='fake', log=None):
+    """Создаёт набор данных по config и возвращает id пользователей."""
+    return FakeDataGenerator(config, prefix, log=log).generate()
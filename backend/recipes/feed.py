@@ -0,0 +1,130 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+
+Рецепт обычного автора при публикации раскладывается по лентам его
+подписчиков (TimelineEntry), поэтому чтение ленты — выборка по индексу
+(подписчик, дата) без обхода подписок. У авторов с числом подписчиков
+больше FEED_FANOUT_LIMIT раскладка была бы слишком дорогой: их рецепты
+не раскладываются, а подмешиваются при чтении отдельной выборкой по
+индексу (автор, дата). Обе выборки ограничены размером страницы и
+сливаются по (дата, id).
+
+При подписке в ленту добавляются последние FEED_BACKFILL рецептов автора,
+при отписке его рецепты из ленты удаляются. Рецепты, созданные в обход
+RecipeViewSet (импорт, синтетические данные), и рецепты автора, который
+перестал быть популярным, попадают в ленты командой rebuild_feeds.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Follow, Recipe, TimelineEntry
+
+BATCH_SIZE = 5000
+
+
+def is_popular(author):
+    return author.followers_count > settings.FEED_FANOUT_LIMIT
+
+
+def _entries(recipes, follower_ids):
+    return (TimelineEntry(user_id=user_id, recipe_id=recipe.id,
+                          author_id=recipe.author_id,
+                          pub_date=recipe.pub_date)
+            for recipe in recipes for user_id in follower_ids)
+
+
+def _write(entries):
+    entries = iter(entries)
+    written = 0
+    while batch := list(islice(entries, BATCH_SIZE)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        written += len(batch)
+    return written
+
+
+def fan_out(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+    if is_popular(recipe.author):
+        return 0
+    follower_ids = Follow.objects.filter(
+        author_id=recipe.author_id).values_list('user_id', flat=True)
+    return _write(_entries([recipe], follower_ids.iterator()))
+
+
+def backfill(user_id, *authors):
+    """Добавляет в ленту подписчика последние рецепты авторов."""
+    author_ids = [author.id for author in authors if not is_popular(author)]
+    if not author_ids:
+        return 0
+    recipes = Recipe.objects.filter(author_id__in=author_ids).annotate(
+        row_number=Window(RowNumber(), partition_by=F('author'),
+                          order_by=(F('pub_date').desc(), F('id').desc())),
+    ).filter(row_number__lte=settings.FEED_BACKFILL).only(
+        'id', 'author_id', 'pub_date')
+    return _write(_entries(recipes, [user_id]))
+
+
+def remove(user_id, *author_ids):
+    """Убирает рецепты авторов из ленты бывшего подписчика."""
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 author_id__in=author_ids).delete()
+
+
+@transaction.atomic
+def rebuild():
+    """Заполняет ленты заново по текущим подпискам, возвращает число строк."""
+    TimelineEntry.objects.all().delete()
+    written = 0
+    authors = Follow.objects.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).values_list('author_id', flat=True).distinct().order_by('author_id')
+    for author_id in list(authors):
+        recipes = list(Recipe.objects.filter(author_id=author_id).only(
+            'id', 'author_id', 'pub_date').order_by(
+            '-pub_date', '-id')[:settings.FEED_BACKFILL])
+        if recipes:
+            written += _write(_entries(recipes, Follow.objects.filter(
+                author_id=author_id).values_list('user_id', flat=True)))
+    return written
+
+
+def _before(date_field, id_field, position):
+    """Условие «строго раньше position» по убыванию (дата, id)."""
+    pub_date, pk = position
+    return (Q(**{f'{date_field}__lt': pub_date})
+            | Q(**{date_field: pub_date, f'{id_field}__lt': pk}))
+
+
+def get_page(user, limit, position=None):
+    """
+    Страница ленты: [(дата, id рецепта)] по убыванию и позиция следующей
+    страницы (None, если это последняя).
+    """
+    timeline = TimelineEntry.objects.filter(user=user)
+    popular = Recipe.objects.filter(author__in=Follow.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values('author_id'))
+    if position is not None:
+        timeline = timeline.filter(_before('pub_date', 'recipe_id', position))
+        popular = popular.filter(_before('pub_date', 'id', position))
+    sources = (
+        timeline.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id')[:limit + 1],
+        popular.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id')[:limit + 1],
+    )
+    # Рецепты автора, ставшего популярным, могут быть в обоих источниках.
+    seen = set()
+    page = []
+    for pub_date, recipe_id in heapq.merge(*sources, reverse=True):
+        if recipe_id not in seen:
+            seen.add(recipe_id)
+            page.append((pub_date, recipe_id))
+    next_position = page[limit - 1] if len(page) > limit else None
+    return page[:limit], next_position
@@ -0,0 +1,203 @@
+"""
+Уменьшенные копии изображений рецептов и аватаров.
+
+После сохранения картинки её копии нужной ширины в форматах WebP и, если
+Pillow собран с его поддержкой, AVIF готовятся в пуле потоков после
+фиксации транзакции, не задерживая ответ. Имена готовых копий
+записываются в JSON-поле <поле>_variants модели вида
+{'webp': {'400': 'recipes/images/abc_400.webp'}}; пока копий нет, поле
+пустое и клиент использует оригинал. Смену картинки замечают сигналы
+pre_save/post_save (см. recipes.signals); файлы прежних копий удаляются
+при смене картинки и при удалении рецепта или пользователя. Копии для уже
+загруженных картинок строит команда generate_image_variants.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Параметры кодирования: (формат Pillow, расширение, опции сохранения).
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', 'avif', {'quality': 60}),
+}
+
+# Отправляется после записи новых копий, sender — модель.
+variants_updated = Signal()
+
+_executor = None
+
+
+def get_formats():
+    # Форматы, для которых в этой сборке Pillow есть кодировщик.
+    Image.init()
+    return [name for name in settings.IMAGE_VARIANT_FORMATS
+            if name in FORMATS and FORMATS[name][0] in Image.SAVE]
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='image-variants')
+    return _executor
+
+
+def variant_name(name, width, extension):
+    return f'{os.path.splitext(name)[0]}_{width}.{extension}'
+
+
+def variant_names(variants):
+    return {name for sizes in (variants or {}).values()
+            for name in sizes.values()}
+
+
+def delete_variants(variants, keep=None, storage=default_storage):
+    """Удаляет файлы копий variants, кроме упомянутых в keep."""
+    for name in variant_names(variants) - variant_names(keep):
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception('Не удалось удалить копию %s', name)
+
+
+def render_variants(name, storage=default_storage):
+    """Сохраняет копии картинки name и возвращает словарь их имён."""
+    formats = get_formats()
+    with storage.open(name) as file, Image.open(file) as image:
+        largest = max(settings.IMAGE_VARIANT_WIDTHS)
+        # Для JPEG декодируем сразу в уменьшенном масштабе.
+        image.draft('RGB', (largest, largest * image.height // image.width))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info
+                or image.mode in ('LA', 'PA') else 'RGB')
+        widths = sorted((width for width in settings.IMAGE_VARIANT_WIDTHS
+                         if width < image.width), reverse=True)
+        variants = {format_name: {} for format_name in formats}
+        for width in widths or [image.width]:
+            image = image.resize(
+                (width, max(1, image.height * width // image.width)),
+                Image.LANCZOS, reducing_gap=3.0)
+            for format_name in formats:
+                pil_format, extension, options = FORMATS[format_name]
+                buffer = BytesIO()
+                image.save(buffer, pil_format, **options)
+                target = variant_name(name, width, extension)
+                if storage.exists(target):
+                    storage.delete(target)
+                variants[format_name][str(width)] = storage.save(
+                    target, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def update_variants(model, pk, field_name, name, previous=None):
+    """
+    Строит копии и записывает их, если картинка за это время не менялась.
+
+    Файлы копий previous, которые не перезаписаны новыми, удаляются.
+    """
+    try:
+        variants = render_variants(name)
+    except Exception:
+        logger.exception('Не удалось подготовить копии %s', name)
+        return False
+    updated = model.objects.filter(pk=pk, **{field_name: name}).update(
+        **{f'{field_name}_variants': variants})
+    if updated:
+        # Копии форматов и ширин, которые больше не строятся.
+        delete_variants(previous, keep=variants)
+        variants_updated.send(sender=model, pk=pk)
+    else:
+        # Картинку успели сменить или объект удалён: копии никому не нужны.
+        delete_variants(variants)
+    return bool(updated)
+
+
+def _run(model, pk, field_name, name):
+    try:
+        update_variants(model, pk, field_name, name)
+    finally:
+        close_old_connections()
+
+
+def image_name(instance, field_name):
+    """Имя файла картинки ('' без неё) или None, если поле не загружено."""
+    if field_name not in instance.__dict__:
+        return None
+    value = instance.__dict__[field_name]
+    return getattr(value, 'name', value) or ''
+
+
+def remember_image(instance, field_name):
+    """Запоминает имя картинки, с которым объект создан или загружен."""
+    instance._image_name = image_name(instance, field_name)
+
+
+def reset_variants(instance, field_name, update_fields=None):
+    """
+    Перед сохранением сбрасывает копии, если картинка сменилась.
+
+    Так копии прежней картинки не попадут в базу вместе с новой, кто бы
+    её ни сменил: API, админка, shell или команда импорта.
+    """
+    instance._previous_variants = None
+    if update_fields is not None and field_name not in update_fields:
+        return
+    variants_field = f'{field_name}_variants'
+    name = image_name(instance, field_name)
+    if instance._state.adding:
+        previous_name, previous_variants = '', {}
+    else:
+        previous_name = getattr(instance, '_image_name', None)
+        previous_variants = getattr(instance, variants_field)
+        if previous_name is None:
+            # Поле не было загружено из базы: узнаём, что в ней сейчас.
+            previous_name, previous_variants = type(instance).objects.filter(
+                pk=instance.pk).values_list(
+                field_name, variants_field).first() or ('', {})
+            previous_name = previous_name or ''
+    if name == previous_name:
+        return
+    instance._previous_variants = previous_variants
+    setattr(instance, variants_field, {})
+
+
+def schedule_variants(instance, field_name, update_fields=None):
+    """
+    После сохранения со сменой картинки ставит её копии в очередь.
+
+    Копии готовятся после фиксации транзакции, тогда же удаляются файлы
+    прежних копий.
+    """
+    previous = instance._previous_variants
+    if previous is None:
+        return
+    instance._previous_variants = None
+    model = type(instance)
+    variants_field = f'{field_name}_variants'
+    name = image_name(instance, field_name)
+    instance._image_name = name
+    if update_fields is not None and variants_field not in update_fields:
+        model.objects.filter(pk=instance.pk).update(**{variants_field: {}})
+    if previous:
+        transaction.on_commit(lambda: delete_variants(previous))
+    if not name:
+        return
+    if not settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(
+            lambda: update_variants(model, instance.pk, field_name, name))
+        return
+    transaction.on_commit(lambda: get_executor().submit(
+        _run, model, instance.pk, field_name, name))
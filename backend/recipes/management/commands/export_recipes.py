@@ -0,0 +1,33 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import export_rows
+
+
+class Command(BaseCommand):
+    help = 'Экспорт рецептов в файл NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON, «-» — вывод в stdout')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов читать из базы за раз')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        exported = 0
+        file = (sys.stdout if options['path'] == '-'
+                else open(options['path'], 'w', encoding='utf-8'))
+        try:
+            for row in export_rows(options['batch_size']):
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                exported += 1
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f'Экспортировано рецептов: {exported} за {elapsed:.1f} с '
+            f'({exported / max(elapsed, 1e-9):.0f} строк/с)'))
@@ -0,0 +1,38 @@
+import time
+from dataclasses import fields
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.fake_data import (BATCH_SIZE, FakeDataConfig,
+                               FakeDataGenerator)
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических пользователей, рецептов, подписок, '
+            'избранного и корзин с популярностью по закону Ципфа')
+
+    def add_arguments(self, parser):
+        for field in fields(FakeDataConfig):
+            parser.add_argument(f'--{field.name}', type=type(field.default),
+                                default=field.default)
+        parser.add_argument('--prefix', default='fake',
+                            help='Префикс имён пользователей и продуктов')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Сколько строк писать за одну вставку')
+
+    def handle(self, *args, **options):
+        config = FakeDataConfig(**{field.name: options[field.name]
+                                   for field in fields(FakeDataConfig)})
+        if config.users < 2 or config.recipes < 2:
+            raise CommandError('Нужно хотя бы 2 пользователя и 2 рецепта.')
+        generator = FakeDataGenerator(config, options['prefix'],
+                                      options['batch_size'],
+                                      log=self.stdout.write)
+        if generator.exists():
+            raise CommandError(
+                f'Пользователи {generator.prefix}* уже есть, укажите '
+                'другой --seed или --prefix.')
+        started = time.monotonic()
+        generator.generate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с'))
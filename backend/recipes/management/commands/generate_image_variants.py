@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipes.images import update_variants
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Подготовка уменьшенных копий изображений рецептов и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии и для картинок, у которых они уже есть')
+
+    def handle(self, *args, **options):
+        for model, field_name in ((Recipe, 'image'), (User, 'avatar')):
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True})
+            if not options['all']:
+                queryset = queryset.filter(**{f'{field_name}_variants': {}})
+            done = failed = 0
+            for pk, name, previous in queryset.values_list(
+                    'pk', field_name, f'{field_name}_variants').iterator():
+                if update_variants(model, pk, field_name, name, previous):
+                    done += 1
+                else:
+                    failed += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: копии подготовлены для '
+                f'{done}, ошибок {failed}'))
@@ -1,16 +1,37 @@
-import json
-from django.core.management.base import BaseCommand
+import os
+import time
 
-from recipes.models import Ingredient
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.catalog import READERS, CatalogError, import_ingredients
 
 
 class Command(BaseCommand):
-    help = 'Импорт ингредиентов из файла JSON'
+    help = 'Импорт ингредиентов из файла JSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='data/ingredients.json',
+                            help='Файл справочника')
+        parser.add_argument('--format', choices=READERS,
+                            help='Формат файла, по умолчанию — по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000)
 
-    def handle(self, *args, **kwargs):
-        with open('data/ingredients.json', 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            Ingredient.objects.bulk_create(Ingredient(**item)
-                                           for item in data)
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        started = time.monotonic()
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            try:
+                stats = import_ingredients(
+                    READERS[file_format](file), options['batch_size'],
+                    on_error=lambda error: self.stderr.write(str(error)))
+            except CatalogError as error:
+                raise CommandError(error)
         self.stdout.write(self.style.SUCCESS(
-            'Ингредиенты успешно импортированы'))
+            f'Ингредиенты успешно импортированы за '
+            f'{time.monotonic() - started:.1f} с: добавлено {stats.inserted}, '
+            f'без изменений {stats.unchanged}, повторов в файле '
+            f'{stats.duplicates}, ошибок {stats.invalid}'))
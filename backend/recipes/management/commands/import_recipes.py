@@ -0,0 +1,60 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import (ImportRowError, RecipeImporter, batched,
+                              delete_checkpoint, load_checkpoint, read_lines)
+
+
+class Command(BaseCommand):
+    help = 'Импорт рецептов из файла NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON, «-» — чтение из stdin')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов писать одной транзакцией')
+        parser.add_argument(
+            '--checkpoint',
+            help='Имя точки продолжения: номер следующей строки хранится '
+                 'в базе и обновляется в одной транзакции с каждой пачкой, '
+                 'а при повторном запуске импорт продолжается с этой строки')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        start = load_checkpoint(checkpoint) if checkpoint else 0
+        if start:
+            self.stdout.write(f'Продолжение со строки {start + 1}')
+        importer = RecipeImporter()
+        started = time.monotonic()
+        imported = skipped = 0
+        file = (sys.stdin if options['path'] == '-'
+                else open(options['path'], encoding='utf-8'))
+        try:
+            for batch in batched(read_lines(file, start),
+                                 options['batch_size']):
+                items = []
+                for number, line in batch:
+                    try:
+                        items.append(importer.build(line))
+                    except ImportRowError as error:
+                        skipped += 1
+                        self.stderr.write(f'Строка {number + 1}: {error}')
+                importer.write(items, checkpoint, batch[-1][0] + 1)
+                imported += len(items)
+                self.stdout.write(
+                    f'Импортировано {imported}, '
+                    f'{self.rate(imported + skipped, started)} строк/с')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        if checkpoint:
+            delete_checkpoint(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецепты импортированы: {imported}, пропущено строк: {skipped}, '
+            f'{time.monotonic() - started:.1f} с '
+            f'({self.rate(imported + skipped, started)} строк/с)'))
+
+    @staticmethod
+    def rate(rows, started):
+        return f'{rows / max(time.monotonic() - started, 1e-9):.0f}'
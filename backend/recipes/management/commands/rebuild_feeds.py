@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Пересборка лент подписок: последние рецепты каждого автора '
+            'раскладываются по лентам его подписчиков')
+
+    def handle(self, *args, **options):
+        created = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок пересобраны, записей: {created}'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересборка полнотекстового индекса рецептов'
+
+    def handle(self, *args, **kwargs):
+        update_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            'Поисковый индекс рецептов пересобран'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Пересборка списков покупок по корзинам пользователей '
+            'или проверка их согласованности')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сравнить списки с корзинами, ничего не меняя')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            return self.check_consistency()
+
+        created = ShoppingListItem.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, позиций: {created}'))
+
+    def check_consistency(self):
+        expected = {
+            (user_id, ingredient_id): total for user_id, ingredient_id, total
+            in ShoppingListItem.objects.expected().iterator()}
+        mismatches = 0
+        for user_id, ingredient_id, total in (
+                ShoppingListItem.objects.values_list(
+                    'user_id', 'ingredient_id', 'total_amount').iterator()):
+            expected_total = expected.pop((user_id, ingredient_id), None)
+            if expected_total != total:
+                mismatches += 1
+                self.stdout.write(
+                    f'user={user_id} ingredient={ingredient_id}: '
+                    f'в списке {total}, ожидается {expected_total}')
+        for (user_id, ingredient_id), total in expected.items():
+            mismatches += 1
+            self.stdout.write(f'user={user_id} ingredient={ingredient_id}: '
+                              f'нет в списке, ожидается {total}')
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {mismatches}. '
+                'Запустите rebuild_shopping_lists без --check.')
+        self.stdout.write(self.style.SUCCESS('Списки покупок согласованы'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ranking import update_ranking
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт популярности рецептов для ленты trending. '
+            'Запускается периодически, например из cron')
+
+    def handle(self, *args, **kwargs):
+        count = update_ranking()
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность пересчитана, рецептов в рейтинге: {count}'))
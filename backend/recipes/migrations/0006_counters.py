@@ -0,0 +1,60 @@
+# Generated by Django 4.2.9 on 2026-10-17 23:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Favorite', 'recipe', 'Recipe', 'favorites_count'),
+    ('ShoppingCart', 'recipe', 'Recipe', 'shopping_cart_count'),
+    ('Recipe', 'author', 'User', 'recipes_count'),
+    ('Follow', 'author', 'User', 'followers_count'),
+    ('Follow', 'user', 'User', 'follows_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for source, field, target, counter in COUNTERS:
+        source = apps.get_model('recipes', source)
+        apps.get_model('recipes', target).objects.update(**{
+            counter: Coalesce(Subquery(
+                source.objects.filter(**{field: OuterRef('pk')}).order_by()
+                .values(field).annotate(count=Count('pk')).values('count')
+            ), 0)
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='follows_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
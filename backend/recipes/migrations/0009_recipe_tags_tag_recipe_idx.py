@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def create_tag_recipe_index(apps, schema_editor):
+    # Уникальный индекс (recipe_id, tag_id) промежуточной таблицы служит
+    # проверке тегов одного рецепта, а этот — выборке рецептов по тегам.
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe_idx '
+        'ON recipes_recipe_tags (tag_id, recipe_id)'
+    )
+
+
+def drop_tag_recipe_index(apps, schema_editor):
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS recipes_recipe_tags_tag_recipe_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_tag_recipe_index, drop_tag_recipe_index),
+    ]
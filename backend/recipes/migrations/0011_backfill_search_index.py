@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# Поле и таблица поиска из 0004 создавались пустыми: без этого шага
+# существующие рецепты не находились бы до rebuild_search_index. SQL
+# записан здесь, а не взят из recipes.search, чтобы миграция не зависела
+# от будущих изменений моделей.
+INGREDIENT_NAMES = (
+    "SELECT {aggregate}(ingredient.name, ' ') "
+    'FROM recipes_recipeingredient AS recipe_ingredient '
+    'JOIN recipes_ingredient AS ingredient '
+    'ON ingredient.id = recipe_ingredient.ingredient_id '
+    'WHERE recipe_ingredient.recipe_id = recipes_recipe.id'
+)
+
+POSTGRESQL_BACKFILL = (
+    'UPDATE recipes_recipe SET search_vector = '
+    "setweight(to_tsvector('russian', COALESCE(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', COALESCE(({names}), '')), 'B') || "
+    "setweight(to_tsvector('russian', COALESCE(text, '')), 'C')"
+).format(names=INGREDIENT_NAMES.format(aggregate='string_agg'))
+
+SQLITE_BACKFILL = (
+    'INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) '
+    'SELECT id, name, text, ({names}) FROM recipes_recipe'
+).format(names=INGREDIENT_NAMES.format(aggregate='group_concat'))
+
+
+def backfill_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_BACKFILL)
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DELETE FROM recipes_recipe_fts')
+        schema_editor.execute(SQLITE_BACKFILL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_timeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
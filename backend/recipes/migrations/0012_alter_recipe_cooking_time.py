@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2026-10-18 00:09
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_backfill_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.PositiveIntegerField(help_text='Время в минутах', validators=[django.core.validators.MinValueValidator(1, 'Время не может быть меньше 1')], verbose_name='Время (мин)'),
+        ),
+    ]
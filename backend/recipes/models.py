@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import RegexValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 
 COOKING_TIME_MIN_VALUE = 1
 AMOUNT_MIN_VALUE = 1
@@ -11,6 +12,8 @@ class User(AbstractUser):
                               max_length=254)
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True,
                                verbose_name='Аватар')
+    avatar_variants = models.JSONField('Копии аватара', default=dict,
+                                       blank=True, editable=False)
     username = models.CharField(
         max_length=150,
         unique=True,
@@ -25,6 +28,12 @@ class User(AbstractUser):
                                   blank=True)
     last_name = models.CharField(max_length=150, verbose_name='Фамилия',
                                  blank=True)
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False)
+    follows_count = models.PositiveIntegerField(
+        'Подписок', default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -45,6 +54,8 @@ class UserRecipeBase(models.Model):
     recipe = models.ForeignKey('Recipe', on_delete=models.CASCADE,
                                verbose_name='Рецепт',
                                related_name='%(class)ss')
+    created = models.DateTimeField('Дата добавления', auto_now_add=True,
+                                   db_index=True)
 
     class Meta:
         abstract = True
@@ -89,12 +100,45 @@ class Ingredient(models.Model):
         ]
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self, user):
+        """Подгружает связанные данные и флаги пользователя для карточек."""
+        authors = User.objects.all()
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=models.Exists(
+                Follow.objects.filter(user=user, author=models.OuterRef('pk'))
+            ))
+        # Названия тегов и продуктов сериализаторы берут из справочников
+        # в памяти (api.references), здесь достаточно id.
+        return self.defer('search_vector').prefetch_related(
+            models.Prefetch('author', queryset=authors),
+            models.Prefetch('tags', queryset=Tag.objects.only('id')),
+            'recipe_ingredients',
+        ).with_user_flags(user)
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                verbose_name='Автор')
     name = models.CharField(max_length=256, verbose_name='Название')
     image = models.ImageField(upload_to='recipes/images/',
                               verbose_name='Изображение')
+    image_variants = models.JSONField('Копии изображения', default=dict,
+                                      blank=True, editable=False)
     text = models.TextField('Текст')
     ingredients = models.ManyToManyField(Ingredient,
                                          through='RecipeIngredient',
@@ -110,6 +154,13 @@ class Recipe(models.Model):
                 f'Время не может быть меньше {COOKING_TIME_MIN_VALUE}')])
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False, db_index=True)
+    shopping_cart_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -119,6 +170,12 @@ class Recipe(models.Model):
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_pub_date_idx'),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -174,3 +231,183 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user.username} подписан на {self.author.username}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def apply_amounts(self, user_ids, amounts):
+        """
+        Прибавляет количества продуктов к спискам покупок пользователей.
+
+        amounts — словарь {id продукта: количество}, отрицательные значения
+        уменьшают итог, позиции с нулевым итогом удаляются.
+        """
+        amounts = {ingredient_id: amount
+                   for ingredient_id, amount in amounts.items() if amount}
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                                  total_amount=0)
+                 for user_id in user_ids for ingredient_id in amounts),
+                ignore_conflicts=True)
+            self.filter(user_id__in=user_ids,
+                        ingredient_id__in=amounts).update(
+                total_amount=models.F('total_amount') + models.Case(
+                    *(models.When(ingredient_id=ingredient_id,
+                                  then=models.Value(amount))
+                      for ingredient_id, amount in amounts.items()),
+                    default=models.Value(0)))
+            self.filter(user_id__in=user_ids, total_amount__lte=0).delete()
+
+    @staticmethod
+    def recipe_amounts(*recipes):
+        """Суммы продуктов рецептов (объекты или id): {продукт: кол-во}."""
+        amounts = {}
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe__in=recipes).values_list('ingredient_id', 'amount'):
+            amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+        return amounts
+
+    def add_recipe(self, user_id, *recipes):
+        self.apply_amounts([user_id], self.recipe_amounts(*recipes))
+
+    def remove_recipe(self, user_id, *recipes):
+        self.apply_amounts([user_id], {
+            ingredient_id: -amount for ingredient_id, amount
+            in self.recipe_amounts(*recipes).items()})
+
+    def apply_to_carts(self, recipe, amounts):
+        """Прибавляет amounts к спискам всех, у кого рецепт в корзине."""
+        self.apply_amounts(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True), amounts)
+
+    def remove_recipe_everywhere(self, recipe):
+        """Убирает рецепт из списков всех, у кого он в корзине."""
+        self.apply_to_carts(recipe, {
+            ingredient_id: -amount for ingredient_id, amount
+            in self.recipe_amounts(recipe).items()})
+
+    def update_recipe(self, recipe, old_amounts, new_amounts=None):
+        """Переносит изменение состава рецепта в списки покупок."""
+        if new_amounts is None:
+            new_amounts = self.recipe_amounts(recipe)
+        self.apply_to_carts(recipe, {
+            ingredient_id: (new_amounts.get(ingredient_id, 0)
+                            - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in new_amounts.keys() | old_amounts.keys()})
+
+    @transaction.atomic
+    def rebuild(self, batch_size=1000):
+        """Пересобирает все списки покупок по корзинам, возвращает позиций."""
+        self.all().delete()
+        batch = []
+        created = 0
+        for user_id, ingredient_id, total in self.expected().iterator():
+            batch.append(ShoppingListItem(user_id=user_id,
+                                          ingredient_id=ingredient_id,
+                                          total_amount=total))
+            if len(batch) == batch_size:
+                self.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        self.bulk_create(batch)
+        return created + len(batch)
+
+    def expected(self):
+        """Итоги списков покупок, посчитанные заново по корзинам."""
+        return RecipeIngredient.objects.filter(
+            recipe__shoppingcarts__isnull=False).values(
+            'recipe__shoppingcarts__user_id', 'ingredient_id').annotate(
+            total=models.Sum('amount')).order_by().values_list(
+            'recipe__shoppingcarts__user_id', 'ingredient_id', 'total')
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='shopping_list',
+                             verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='shopping_list_items',
+                                   verbose_name='Продукт')
+    total_amount = models.IntegerField('Количество')
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item')
+        ]
+        verbose_name = 'продукт списка покупок'
+        verbose_name_plural = 'Продукты списков покупок'
+
+    def __str__(self):
+        return (f'{self.user.username}: {self.ingredient.name} '
+                f'— {self.total_amount}')
+
+
+class RecipeRanking(models.Model):
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='ranking',
+                                  verbose_name='Рецепт')
+    score = models.FloatField('Популярность', db_index=True)
+    updated_at = models.DateTimeField('Пересчитано', auto_now=True)
+
+    class Meta:
+        ordering = ('-score',)
+        verbose_name = 'популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+
+    def __str__(self):
+        return f'{self.recipe.name}: {self.score:.2f}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписчика (см. recipes.feed)."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline',
+                             verbose_name='Подписчик')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='timeline_entries',
+                               verbose_name='Рецепт')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='+', verbose_name='Автор')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'recipe'),
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='timeline_user_pub_date_idx'),
+        ]
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'{self.user.username}: {self.recipe.name}'
+
+
+class ImportCheckpoint(models.Model):
+    """Место продолжения импорта (см. команду import_recipes)."""
+
+    name = models.CharField('Название', max_length=255, unique=True)
+    next_line = models.PositiveBigIntegerField('Следующая строка',
+                                               default=0)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'точка продолжения импорта'
+        verbose_name_plural = 'Точки продолжения импорта'
+
+    def __str__(self):
+        return f'{self.name}: строка {self.next_line + 1}'
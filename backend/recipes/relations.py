@@ -0,0 +1,162 @@
+"""
+Избранное, корзина и подписки одним запросом к их таблице.
+
+Связи добавляются через INSERT ... ON CONFLICT DO NOTHING RETURNING, а
+удаляются через DELETE ... RETURNING. Запрос сразу возвращает строки,
+которые действительно изменились, и счётчики со списками покупок
+сдвигаются только на них. При одновременных запросах (двойной клик,
+пересекающиеся массовые действия) каждую строку меняет только один из
+них: остальные ждут на уникальном индексе и получают «уже есть» или
+«нет», без предварительного SELECT и без повторов после IntegrityError.
+
+Сигналы моделей при этом не срабатывают, поэтому счётчики, списки
+покупок и ленты подписок обновляются здесь явно, а кэш сбрасывается
+через relations_changed. Массовые действия (recipes.bulk) используют те
+же функции.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+from . import feed
+from .counters import change_counters
+from .models import Follow, ShoppingCart, ShoppingListItem
+
+# Отправляется после изменения связей пользователя, sender — модель связи.
+relations_changed = Signal()
+
+
+def _column(meta, name):
+    return connection.ops.quote_name(meta.get_field(name).column)
+
+
+def insert_ignore(model, returning, ids, **values):
+    """
+    Вставляет связи model с объектами ids, пропуская уже имеющиеся.
+
+    returning — внешний ключ на эти объекты, values — остальные поля
+    строк. Строки выбираются из таблицы объектов (INSERT ... SELECT),
+    поэтому несуществующие id пропускаются без ошибки внешнего ключа.
+    Возвращает id объектов, связи с которыми действительно добавлены.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    meta = model._meta
+    target = meta.get_field(returning)
+    source = target.related_model._meta
+    instance = model(**values)
+    fields = [field for field in meta.local_concrete_fields
+              if field is not meta.auto_field and field is not target]
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column)
+                        for field in [*fields, target])
+    source_pk = quote_name(source.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote_name(meta.db_table)} ({columns}) '
+            f'SELECT {"%s, " * len(fields)}{source_pk} '
+            f'FROM {quote_name(source.db_table)} '
+            f'WHERE {source_pk} IN ({", ".join(["%s"] * len(ids))}) '
+            f'ON CONFLICT DO NOTHING RETURNING {quote_name(target.column)}',
+            [field.get_db_prep_save(field.pre_save(instance, True),
+                                    connection)
+             for field in fields] + ids)
+        return [value for value, in cursor.fetchall()]
+
+
+def delete_returning(model, returning, **conditions):
+    """
+    Удаляет строки одним DELETE ... RETURNING без сигналов.
+
+    conditions — {поле: значение или список значений}. Возвращает значения
+    поля returning у удалённых строк.
+    """
+    meta = model._meta
+    where = []
+    params = []
+    for name, value in conditions.items():
+        if isinstance(value, (list, tuple, set)):
+            value = list(value)
+            if not value:
+                return []
+            where.append(f'{_column(meta, name)} IN '
+                         f'({", ".join(["%s"] * len(value))})')
+            params += value
+        else:
+            where.append(f'{_column(meta, name)} = %s')
+            params.append(value)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(meta.db_table)} '
+            f'WHERE {" AND ".join(where)} '
+            f'RETURNING {_column(meta, returning)}', params)
+        return [value for value, in cursor.fetchall()]
+
+
+def recipes_added(model, user, recipe_ids):
+    change_counters(model, {'recipe': Counter(recipe_ids)}, 1)
+    if model is ShoppingCart:
+        ShoppingListItem.objects.add_recipe(user.id, *recipe_ids)
+    relations_changed.send(sender=model, user_id=user.id)
+
+
+def recipes_removed(model, user, recipe_ids):
+    change_counters(model, {'recipe': Counter(recipe_ids)}, -1)
+    if model is ShoppingCart:
+        ShoppingListItem.objects.remove_recipe(user.id, *recipe_ids)
+    relations_changed.send(sender=model, user_id=user.id)
+
+
+def authors_followed(user, authors):
+    change_counters(Follow, {
+        'author': Counter(author.id for author in authors),
+        'user': {user.id: len(authors)}}, 1)
+    feed.backfill(user.id, *authors)
+    relations_changed.send(sender=Follow, user_id=user.id)
+
+
+def authors_unfollowed(user, author_ids):
+    change_counters(Follow, {'author': Counter(author_ids),
+                             'user': {user.id: len(author_ids)}}, -1)
+    feed.remove(user.id, *author_ids)
+    relations_changed.send(sender=Follow, user_id=user.id)
+
+
+@transaction.atomic
+def add_recipe(model, user, recipe):
+    """Добавляет рецепт в избранное или корзину, False — если он там был."""
+    added = insert_ignore(model, 'recipe_id', [recipe.id], user_id=user.id)
+    if added:
+        recipes_added(model, user, added)
+    return bool(added)
+
+
+@transaction.atomic
+def remove_recipe(model, user, recipe):
+    """Убирает рецепт из избранного или корзины, False — если его не было."""
+    removed = delete_returning(model, 'recipe_id', user_id=user.id,
+                               recipe_id=recipe.id)
+    if removed:
+        recipes_removed(model, user, removed)
+    return bool(removed)
+
+
+@transaction.atomic
+def follow(user, author):
+    """Подписывает на автора, False — если подписка уже была."""
+    added = insert_ignore(Follow, 'author_id', [author.id], user_id=user.id)
+    if added:
+        authors_followed(user, [author])
+    return bool(added)
+
+
+@transaction.atomic
+def unfollow(user, author):
+    """Отписывает от автора, False — если подписки не было."""
+    removed = delete_returning(Follow, 'author_id', user_id=user.id,
+                               author_id=author.id)
+    if removed:
+        authors_unfollowed(user, removed)
+    return bool(removed)
@@ -0,0 +1,115 @@
+"""
+Полнотекстовый поиск рецептов по названию, описанию и продуктам.
+
+На PostgreSQL используется поле Recipe.search_vector с GIN-индексом и
+русской морфологией, на SQLite — виртуальная таблица FTS5. Индекс
+обновляется сигналами рецептов, их продуктов и самих продуктов (см.
+schedule_search_index), заполняется миграцией для уже существующих
+рецептов и пересобирается командой rebuild_search_index. Массовые
+загрузки в обход сигналов вызывают update_search_index() сами.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+
+from .models import Ingredient, Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса колонок FTS5 для bm25: название, описание, продукты.
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+
+def update_search_index(recipe_ids=None):
+    """Пересчитывает поисковый индекс рецептов (всех, если ids не даны)."""
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+    if connection.vendor == 'postgresql':
+        _update_search_vector(recipe_ids)
+    elif connection.vendor == 'sqlite':
+        _update_fts(recipe_ids)
+
+
+def schedule_search_index(recipe_ids):
+    """Обновляет индекс рецептов после фиксации текущей транзакции."""
+    recipe_ids = list(recipe_ids)
+    # К фиксации рецепт уже сохранён вместе с продуктами, даже если они
+    # пишутся после самого рецепта.
+    transaction.on_commit(lambda: update_search_index(recipe_ids))
+
+
+def _update_search_vector(recipe_ids):
+    from django.contrib.postgres.aggregates import StringAgg
+    from django.contrib.postgres.search import SearchVector
+
+    ingredients = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk')).values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')).values('names')
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(ingredients), weight='B',
+                       config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    ))
+
+
+def _update_fts(recipe_ids):
+    delete_sql = f'DELETE FROM {FTS_TABLE}'
+    insert_sql = (
+        f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+        f'SELECT recipe.id, recipe.name, recipe.text, '
+        f"(SELECT group_concat(ingredient.name, ' ') "
+        f'FROM {RecipeIngredient._meta.db_table} AS recipe_ingredient '
+        f'JOIN {Ingredient._meta.db_table} AS ingredient '
+        f'ON ingredient.id = recipe_ingredient.ingredient_id '
+        f'WHERE recipe_ingredient.recipe_id = recipe.id) '
+        f'FROM {Recipe._meta.db_table} AS recipe'
+    )
+    params = []
+    if recipe_ids is not None:
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        delete_sql += f' WHERE rowid IN ({placeholders})'
+        insert_sql += f' WHERE recipe.id IN ({placeholders})'
+        params = recipe_ids
+    with connection.cursor() as cursor:
+        cursor.execute(delete_sql, params)
+        cursor.execute(insert_sql, params)
+
+
+def search_recipes(recipes, query):
+    """Отбирает рецепты по запросу и сортирует их по релевантности."""
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                                   search_type='websearch')
+        return recipes.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query),
+        ).order_by('-rank', '-pub_date')
+
+    if connection.vendor == 'sqlite':
+        words = re.findall(r'\w+', query)
+        if not words:
+            return recipes.none()
+        match = ' '.join(f'"{word}"*' for word in words)
+        # Таблица FTS присоединяется по rowid, и bm25() считается один раз
+        # для найденной строки, а не подзапросом для каждого рецепта.
+        return recipes.extra(
+            select={'rank': f'-bm25({FTS_TABLE}, %s, %s, %s)'},
+            select_params=FTS_WEIGHTS,
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {Recipe._meta.db_table}.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).order_by('-rank', '-pub_date')
+
+    return recipes.filter(
+        Q(name__icontains=query) | Q(text__icontains=query)
+        | Q(ingredients__name__icontains=query)
+    ).annotate(rank=Value(0)).distinct()
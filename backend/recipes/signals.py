@@ -0,0 +1,169 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import feed
+from .counters import change_instance_counters
+from .images import (delete_variants, remember_image, reset_variants,
+                     schedule_variants)
+from .models import (Favorite, Follow, Ingredient, Recipe,
+                     RecipeIngredient, ShoppingCart, ShoppingListItem)
+from .search import schedule_search_index
+
+User = get_user_model()
+
+# Поле картинки моделей, для которых готовятся уменьшенные копии.
+IMAGE_FIELDS = {Recipe: 'image', User: 'avatar'}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def increment_counters(instance, created, **kwargs):
+    if created:
+        change_instance_counters(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counters(instance, **kwargs):
+    change_instance_counters(instance, -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.user_id, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_feed(instance, **kwargs):
+    feed.remove(instance.user_id, instance.author_id)
+
+
+def deleted_directly(sender, origin):
+    """Удаляется ли строка сама, а не каскадом от рецепта, автора и т. п."""
+    return isinstance(origin, sender) or (
+        isinstance(origin, QuerySet) and origin.model is sender)
+
+
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_previous(sender, instance, **kwargs):
+    # Правка существующей строки (например, в админке) переносится в
+    # списки покупок как разница между старой и новой версией.
+    instance._previous = None
+    if instance.pk is not None:
+        instance._previous = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_cart_to_shopping_list(instance, **kwargs):
+    previous = instance._previous
+    if previous is not None:
+        if (previous.user_id, previous.recipe_id) == (instance.user_id,
+                                                      instance.recipe_id):
+            return
+        ShoppingListItem.objects.remove_recipe(previous.user_id,
+                                               previous.recipe_id)
+    ShoppingListItem.objects.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_cart_from_shopping_list(sender, instance, origin=None, **kwargs):
+    # При удалении рецепта списки уже поправлены в pre_delete, при
+    # удалении пользователя или продукта позиции удаляются каскадом.
+    if deleted_directly(sender, origin):
+        ShoppingListItem.objects.remove_recipe(instance.user_id,
+                                               instance.recipe_id)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def apply_ingredient_to_shopping_lists(instance, **kwargs):
+    changes = defaultdict(lambda: defaultdict(int))
+    previous = instance._previous
+    if previous is not None:
+        changes[previous.recipe_id][previous.ingredient_id] -= previous.amount
+    changes[instance.recipe_id][instance.ingredient_id] += instance.amount
+    for recipe_id, amounts in changes.items():
+        ShoppingListItem.objects.apply_to_carts(recipe_id, amounts)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_ingredient_from_shopping_lists(sender, instance, origin=None,
+                                          **kwargs):
+    if deleted_directly(sender, origin):
+        ShoppingListItem.objects.apply_to_carts(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount})
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(instance, **kwargs):
+    # Корзины и продукты рецепта ещё не удалены каскадом.
+    ShoppingListItem.objects.remove_recipe_everywhere(instance)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def index_recipe(instance, **kwargs):
+    schedule_search_index([instance.id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def index_recipe_ingredients(instance, **kwargs):
+    schedule_search_index([instance.recipe_id])
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def reindex_recipe_without_ingredient(sender, instance, origin=None,
+                                      **kwargs):
+    # Удаление рецепта или продукта переиндексирует свои рецепты само.
+    if deleted_directly(sender, origin):
+        schedule_search_index([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def index_ingredient_recipes(instance, created=False, **kwargs):
+    if not created:
+        schedule_search_index(RecipeIngredient.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_init, sender=Recipe)
+@receiver(post_init, sender=User)
+def remember_image_name(sender, instance, **kwargs):
+    remember_image(instance, IMAGE_FIELDS[sender])
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def reset_image_variants(sender, instance, update_fields=None, **kwargs):
+    reset_variants(instance, IMAGE_FIELDS[sender], update_fields)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def schedule_image_variants(sender, instance, update_fields=None, **kwargs):
+    schedule_variants(instance, IMAGE_FIELDS[sender], update_fields)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_image_variants(instance, **kwargs):
+    variants = instance.image_variants
+    if variants:
+        transaction.on_commit(lambda: delete_variants(variants))
+
+
+@receiver(post_delete, sender=User)
+def delete_avatar_variants(instance, **kwargs):
+    variants = instance.avatar_variants
+    if variants:
+        transaction.on_commit(lambda: delete_variants(variants))